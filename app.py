@@ -1,7 +1,7 @@
 from flask import Flask, request, jsonify, send_file
 from flask_cors import CORS
 from PIL import Image
-import numpy as np
+from stego import lsb, payload, raster
 import io
 import os
 from cryptography.fernet import Fernet
@@ -30,47 +30,21 @@ def decrypt_message(encrypted_message, key):
 
 def text_to_binary(data):
     """Convert bytes data to binary string."""
-    return ''.join(format(byte, '08b') for byte in data)
+    return lsb.text_to_binary(data)
 
 def binary_to_text(binary_string):
     """Convert binary string to bytes data and decode to text."""
-    chars = [binary_string[i:i+8] for i in range(0, len(binary_string), 8)]
-    return bytes(int(char, 2) for char in chars)
+    return lsb.binary_to_text(binary_string)
 
-def encode_image(image, binary_data):
+def encode_image(image, data, depth=1):
     """Encode binary data into an image using LSB steganography."""
-    pixels = np.array(image.convert('RGB'))
-    pixels_flat = pixels.flatten()
-    text_index = 0
-
-    if len(binary_data) > len(pixels_flat):
-        raise ValueError("Binary data is too large to encode in this image.")
-
-    for i in range(len(pixels_flat)):
-        if text_index < len(binary_data):
-            pixel = pixels_flat[i]
-            new_pixel = pixel & ~1 | int(binary_data[text_index])
-            pixels_flat[i] = new_pixel
-            text_index += 1
-        else:
-            break
-
-    encoded_pixels = pixels_flat.reshape(pixels.shape)
-    return Image.fromarray(encoded_pixels.astype('uint8'), 'RGB')
+    # Only the rows the payload covers are copied out and written back
+    return raster.embed(image, lsb.as_bits(data, depth), depth)
 
 def decode_image(encoded_image):
     """Decode binary data from an image using LSB steganography."""
-    pixels = np.array(encoded_image.convert('RGB'))
-    pixels_flat = pixels.flatten()
-    binary_data = ''.join(str(pixel & 1) for pixel in pixels_flat)
-    
-    # Stop at the end delimiter (used here as '1111111111111110')
-    delimiter = '1111111111111110'
-    if delimiter in binary_data:
-        binary_data = binary_data[:binary_data.index(delimiter)]
-    else:
-        raise ValueError("End delimiter not found in the encoded image.")
-    return binary_data
+    # Read the payload header; legacy images end with the delimiter '1111111111111110'
+    return payload.read(raster.iter_chunks(encoded_image), delimiter='1111111111111110')
 
 @app.route('/encode', methods=['POST'])
 def encode():
@@ -82,29 +56,36 @@ def encode():
             return jsonify({"error": "Text message not provided"}), 400
         if 'key' not in request.form:
             return jsonify({"error": "Secret key not provided"}), 400
+        if request.form.get('preset', raster.OUTPUT_PRESET) not in raster.OUTPUT_PRESETS:
+            return jsonify({"error": f"Preset must be one of: {', '.join(raster.OUTPUT_PRESETS)}"}), 400
 
         # Get image, text, and user-provided key from the request
         image_file = request.files['image']
         text = request.form['text']
         user_key = request.form['key']
+        depth = lsb.parse_depth(request.form.get('depth'))
+
+        # Pick a lossless output format from the Accept header; PNG by default
+        mimetype = request.accept_mimetypes.best_match(raster.OUTPUT_FORMATS, default='image/png')
 
         # Process the user-provided key to ensure it's compatible with Fernet
         fernet_key = process_user_key(user_key)
 
         # Encrypt the message using the processed key
         encrypted_message = encrypt_message(text, fernet_key)
-        binary_data = text_to_binary(encrypted_message) + '1111111111111110'
+        data = payload.wrap(encrypted_message, depth=depth)
 
         # Encode the message into the image
         image = Image.open(image_file.stream)
-        encoded_image = encode_image(image, binary_data)
+        encoded_image = encode_image(image, data, depth)
 
         # Prepare image for output
         output = io.BytesIO()
-        encoded_image.save(output, format="PNG")
+        raster.save(encoded_image, output, mimetype, request.form.get('preset'))
         output.seek(0)
 
-        return send_file(output, mimetype='image/png', as_attachment=True, download_name="encoded_image.png")
+        return send_file(output, mimetype=mimetype, as_attachment=True,
+                         download_name=f"encoded_image.{raster.OUTPUT_FORMATS[mimetype][1]}")
 
     except Exception as e:
         print(f"Encoding error: {e}")
@@ -127,10 +108,7 @@ def decode():
 
         # Decode binary data from the image
         encoded_image = Image.open(image_file.stream)
-        binary_data = decode_image(encoded_image)
-        
-        # Convert binary data back to text
-        encrypted_message = binary_to_text(binary_data)
+        encrypted_message = decode_image(encoded_image)
         
         # Decrypt the message
         hidden_message = decrypt_message(encrypted_message, fernet_key)
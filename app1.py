@@ -1,269 +1,17 @@
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify
 from flask_cors import CORS
-from PIL import Image
-import numpy as np
-import io
+from stego import carriers, crypto, lsb, messages, raster, scratch, streams, uploads
 import os
-from cryptography.fernet import Fernet, InvalidToken
-import base64
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.backends import default_backend
-import cv2
-import tempfile
+from cryptography.fernet import InvalidToken
 import logging
 
 app = Flask(__name__)
 CORS(app)
+uploads.init_app(app)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
-# -------------------- Utility Functions -------------------- #
-
-def process_user_key(user_key, salt=None):
-    """
-    Process a user-provided key to make it compatible with Fernet using PBKDF2.
-
-    Args:
-        user_key (str): The user's secret key/password.
-        salt (bytes, optional): Salt for key derivation. Generates a new one if None.
-
-    Returns:
-        tuple: (derived_key, salt)
-    """
-    if not salt:
-        # Generate a random 16-byte salt if not provided
-        salt = os.urandom(16)
-    
-    kdf = PBKDF2HMAC(
-        algorithm=hashes.SHA256(),      # Use SHA256 for the hashing algorithm
-        length=32,                      # Fernet requires a 32-byte key
-        salt=salt,
-        iterations=100_000,             # Number of iterations for key derivation
-        backend=default_backend()
-    )
-    key = base64.urlsafe_b64encode(kdf.derive(user_key.encode()))
-    return key, salt
-
-def encrypt_message(message, key):
-    """
-    Encrypt the message using Fernet symmetric encryption.
-
-    Args:
-        message (str): The plaintext message to encrypt.
-        key (bytes): The derived Fernet key.
-
-    Returns:
-        bytes: The encrypted message.
-    """
-    fernet = Fernet(key)
-    return fernet.encrypt(message.encode())
-
-def decrypt_message(encrypted_message, key):
-    """
-    Decrypt the message using Fernet symmetric encryption.
-
-    Args:
-        encrypted_message (bytes): The encrypted message.
-        key (bytes): The derived Fernet key.
-
-    Returns:
-        str: The decrypted plaintext message.
-    """
-    fernet = Fernet(key)
-    return fernet.decrypt(encrypted_message).decode()
-
-def text_to_binary(data):
-    """
-    Convert bytes data to a binary string.
-
-    Args:
-        data (bytes): The data to convert.
-
-    Returns:
-        str: The binary string representation.
-    """
-    return ''.join(format(byte, '08b') for byte in data)
-
-def binary_to_text(binary_string):
-    """
-    Convert a binary string to bytes data.
-
-    Args:
-        binary_string (str): The binary string to convert.
-
-    Returns:
-        bytes: The resulting bytes data.
-    """
-    chars = [binary_string[i:i+8] for i in range(0, len(binary_string), 8)]
-    return bytes(int(char, 2) for char in chars)
-
-def encode_image(image, binary_data):
-    """
-    Encode binary data into an image using LSB steganography.
-
-    Args:
-        image (PIL.Image.Image): The image to encode data into.
-        binary_data (str): The binary string to embed.
-
-    Returns:
-        PIL.Image.Image: The encoded image.
-    """
-    pixels = np.array(image.convert('RGB'))
-    pixels_flat = pixels.flatten()
-    text_index = 0
-
-    if len(binary_data) > len(pixels_flat):
-        raise ValueError("Binary data is too large to encode in this image.")
-
-    for i in range(len(pixels_flat)):
-        if text_index < len(binary_data):
-            pixel = pixels_flat[i]
-            new_pixel = pixel & ~1 | int(binary_data[text_index])
-            pixels_flat[i] = new_pixel
-            text_index += 1
-        else:
-            break
-
-    encoded_pixels = pixels_flat.reshape(pixels.shape)
-    return Image.fromarray(encoded_pixels.astype('uint8'), 'RGB')
-
-def decode_image(encoded_image, delimiter='10101010101010101010101010101010'):
-    """
-    Decode binary data from an image using LSB steganography.
-
-    Args:
-        encoded_image (PIL.Image.Image): The image to decode data from.
-        delimiter (str): The unique bit sequence marking the end of data.
-
-    Returns:
-        str: The extracted binary string without the delimiter.
-
-    Raises:
-        ValueError: If the delimiter is not found in the encoded data.
-    """
-    pixels = np.array(encoded_image.convert('RGB'))
-    pixels_flat = pixels.flatten()
-    binary_data = ''
-
-    for pixel in pixels_flat:
-        binary_data += str(pixel & 1)
-        if len(binary_data) >= len(delimiter):
-            if binary_data[-len(delimiter):] == delimiter:
-                return binary_data[:-len(delimiter)]
-
-    raise ValueError("End delimiter not found in the encoded image.")
-
-def encode_video(video_path, binary_data, output_path):
-    """
-    Encode binary data into a video using LSB steganography across frames.
-
-    Args:
-        video_path (str): Path to the input video file.
-        binary_data (str): The binary string to embed.
-        output_path (str): Path to save the encoded video.
-
-    Raises:
-        ValueError: If the video file cannot be opened.
-    """
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        raise ValueError("Cannot open the video file.")
-
-    # Get video properties
-    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    frame_width  = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    
-    # Use a lossless codec if available
-    # 'FFV1' is a lossless codec, but its availability depends on your system
-    # If 'FFV1' is not available, you might need to install it or choose another lossless codec
-    # Alternatively, use 'MJPG' with minimal compression as a fallback
-    fourcc = cv2.VideoWriter_fourcc(*'FFV1')  # Attempting to use FFV1
-    
-    out = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
-
-    if not out.isOpened():
-        cap.release()
-        raise ValueError("Cannot open the video writer with the specified codec. Ensure that 'FFV1' is installed or choose a different lossless codec.")
-
-    data_index = 0
-    total_data_length = len(binary_data)
-
-    while cap.isOpened():
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        # Flatten the frame to iterate over pixels
-        flat_frame = frame.flatten()
-
-        for i in range(len(flat_frame)):
-            if data_index < total_data_length:
-                # Modify the LSB of each byte
-                flat_frame[i] = (flat_frame[i] & ~1) | int(binary_data[data_index])
-                data_index += 1
-            else:
-                break
-
-        # Reshape and write the modified frame
-        modified_frame = flat_frame.reshape((frame_height, frame_width, 3))
-        out.write(modified_frame.astype('uint8'))
-
-        if data_index >= total_data_length:
-            # Write the remaining frames without modification
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                out.write(frame)
-            break
-
-    cap.release()
-    out.release()
-
-def decode_video(video_path, delimiter='10101010101010101010101010101010', max_bits=1_000_000):
-    """
-    Decode binary data from a video using LSB steganography across frames.
-
-    Args:
-        video_path (str): Path to the encoded video file.
-        delimiter (str): The unique bit sequence marking the end of data.
-        max_bits (int): Maximum number of bits to read to prevent excessive processing.
-
-    Returns:
-        str: The extracted binary string without the delimiter.
-
-    Raises:
-        ValueError: If the delimiter is not found within the maximum bit limit.
-    """
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        raise ValueError("Cannot open the video file.")
-
-    binary_data = ''
-
-    while cap.isOpened() and len(binary_data) < max_bits:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        # Flatten the frame to iterate over pixels
-        flat_frame = frame.flatten()
-
-        for pixel in flat_frame:
-            binary_data += str(pixel & 1)
-            # Check for delimiter
-            if len(binary_data) >= len(delimiter):
-                if binary_data[-len(delimiter):] == delimiter:
-                    cap.release()
-                    return binary_data[:-len(delimiter)]  # Exclude delimiter
-
-    cap.release()
-    raise ValueError("End delimiter not found in the encoded video.")
-
 # -------------------- Image Encode Endpoint -------------------- #
 
 @app.route('/encode', methods=['POST'])
@@ -275,9 +23,13 @@ def encode():
         - image (file): The image file to embed data into.
         - text (str): The secret message to embed.
         - key (str): The secret key/password for encryption.
+        - depth (int, optional): LSBs written per carrier byte, 1-4 (default 1).
+        - preset (str, optional): Output encoder preset: fast, balanced or small.
 
     Returns:
-        - Encoded image file for download.
+        - Encoded image file for download, as PNG, lossless WebP or TIFF
+          depending on the Accept header. Uncompressed BMP, PPM and TIFF
+          covers are returned in their own format if the client accepts it.
     """
     try:
         # Ensure all required data is present
@@ -287,47 +39,35 @@ def encode():
             return jsonify({"error": "Text message not provided"}), 400
         if 'key' not in request.form:
             return jsonify({"error": "Secret key not provided"}), 400
+        if request.form.get('preset', raster.OUTPUT_PRESET) not in raster.OUTPUT_PRESETS:
+            return jsonify({"error": f"Preset must be one of: {', '.join(raster.OUTPUT_PRESETS)}"}), 400
 
         # Get image, text, and user-provided key from the request
         image_file = request.files['image']
         text = request.form['text']
         user_key = request.form['key']
+        depth = lsb.parse_depth(request.form.get('depth'))
 
-        # Process the user-provided key to ensure it's compatible with Fernet
-        fernet_key, salt = process_user_key(user_key)
-
-        # Encrypt the message using the processed key
-        encrypted_message = encrypt_message(text, fernet_key)
-
-        # Prepend salt to encrypted message
-        salted_encrypted_message = salt + encrypted_message
-
-        # Convert to binary
-        delimiter = '10101010101010101010101010101010'  # 32-bit delimiter
-        binary_data = text_to_binary(salted_encrypted_message) + delimiter  # Delimiter
-
-        # Log the last bits to confirm delimiter
-        if not binary_data.endswith(delimiter):
-            raise ValueError("Delimiter not correctly appended to binary data.")
-        logging.info(f"Delimiter appended correctly: {binary_data.endswith(delimiter)}")
+        # Start deriving the key in the crypto pool; it is only waited for once
+        # the cover is decoded
+        pending_key = crypto.PendingKey(user_key)
+        pending_key.start()
 
-        # Log lengths
-        logging.info(f"Salt length: {len(salt)} bytes")
-        logging.info(f"Encrypted message length: {len(encrypted_message)} bytes")
-        logging.info(f"Salted encrypted message length: {len(salted_encrypted_message)} bytes")
-        logging.info(f"Binary data length: {len(binary_data)} bits")
+        # Carriers are read from a file; small uploads held in memory are saved once
+        image_path = uploads.upload_path(image_file)
 
-        # Encode the message into the image
-        image = Image.open(image_file.stream)
-        encoded_image = encode_image(image, binary_data)
+        # Pick a lossless output format from the Accept header; PNG by default.
+        # Uncompressed covers are encoded in place and sent back in their own
+        # format if asked for by name
+        carrier = carriers.image_output(image_path, request.accept_mimetypes, request.form.get('preset'))
 
-        # Prepare image for output
-        output = io.BytesIO()
-        encoded_image.save(output, format="PNG")
-        output.seek(0)
+        # Encode the message into the image; it is encrypted and given its
+        # length/CRC header once the cover is decoded
+        body = messages.hide(carrier, image_path, lambda: messages.seal(text, pending_key, depth), depth=depth)
 
         logging.info("Image encoding successful.")
-        return send_file(output, mimetype='image/png', as_attachment=True, download_name="encoded_image.png")
+        return Response(body, mimetype=carrier.output[0],
+                        headers=streams.download_headers(body, f"encoded_image.{carrier.output[1]}"))
 
     except Exception as e:
         logging.error(f"Encoding error: {e}")
@@ -357,32 +97,10 @@ def decode():
         image_file = request.files['image']
         user_key = request.form['key']
 
-        # Decode binary data from the image
-        delimiter = '10101010101010101010101010101010'  # 32-bit delimiter
-        encoded_image = Image.open(image_file.stream)
-        binary_data = decode_image(encoded_image, delimiter=delimiter)
-
-        # Log length
-        logging.info(f"Binary data length: {len(binary_data)} bits")
-
-        # Convert binary data back to bytes
-        salted_encrypted_message = binary_to_text(binary_data)
-
-        # Log length
-        logging.info(f"Salted encrypted message length: {len(salted_encrypted_message)} bytes")
-
-        # Extract salt and encrypted message
-        if len(salted_encrypted_message) < 16:
-            raise ValueError("Insufficient data to extract salt.")
-
-        salt = salted_encrypted_message[:16]
-        encrypted_message = salted_encrypted_message[16:]
-
-        # Re-derive the key using the extracted salt
-        fernet_key, _ = process_user_key(user_key, salt)
-
-        # Decrypt the message
-        hidden_message = decrypt_message(encrypted_message, fernet_key)
+        # The key is derived as soon as the salt is extracted, while the rest
+        # of the payload is read
+        image_path = uploads.upload_path(image_file)
+        hidden_message = messages.reveal(carriers.IMAGE, image_path, crypto.PendingKey(user_key))
 
         logging.info("Image decoding successful.")
         return jsonify({"hidden_message": hidden_message})
@@ -402,6 +120,7 @@ def encode_video_endpoint():
         - video (file): The video file to embed data into.
         - text (str): The secret message to embed.
         - key (str): The secret key/password for encryption.
+        - depth (int, optional): LSBs written per carrier byte, 1-4 (default 1).
 
     Returns:
         - Encoded video file for download.
@@ -419,6 +138,7 @@ def encode_video_endpoint():
         video_file = request.files['video']
         text = request.form['text']
         user_key = request.form['key']
+        depth = lsb.parse_depth(request.form.get('depth'))
 
         # Validate video file extension
         ALLOWED_VIDEO_EXTENSIONS = {'avi', 'mp4', 'mov', 'mkv'}
@@ -426,65 +146,40 @@ def encode_video_endpoint():
            video_file.filename.rsplit('.', 1)[1].lower() not in ALLOWED_VIDEO_EXTENSIONS:
             return jsonify({"error": "Unsupported video file type"}), 400
 
-        # Process the user-provided key to ensure it's compatible with Fernet
-        fernet_key, salt = process_user_key(user_key)
-
-        # Encrypt the message using the processed key
-        encrypted_message = encrypt_message(text, fernet_key)
-
-        # Prepend salt to encrypted message
-        salted_encrypted_message = salt + encrypted_message
-
-        # Convert to binary
-        delimiter = '10101010101010101010101010101010'  # 32-bit delimiter
-        binary_data = text_to_binary(salted_encrypted_message) + delimiter  # Delimiter
-
-        # Log the last bits to confirm delimiter
-        if not binary_data.endswith(delimiter):
-            raise ValueError("Delimiter not correctly appended to binary data.")
-        logging.info(f"Delimiter appended correctly: {binary_data.endswith(delimiter)}")
+        # Start deriving the key in the crypto pool; it is only waited for once
+        # the cover is decoded
+        pending_key = crypto.PendingKey(user_key)
+        pending_key.start()
 
-        # Log lengths
-        logging.info(f"Salt length: {len(salt)} bytes")
-        logging.info(f"Encrypted message length: {len(encrypted_message)} bytes")
-        logging.info(f"Salted encrypted message length: {len(salted_encrypted_message)} bytes")
-        logging.info(f"Binary data length: {len(binary_data)} bits")
+        # Media uploads are spooled straight to a named file, so nothing is copied
+        input_video_path = uploads.upload_path(video_file)
 
-        # Save the uploaded video to a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.avi') as temp_input:
-            video_file.save(temp_input.name)
-            input_video_path = temp_input.name
+        # Re-encoded clips can be far larger than the upload; reserve their expected
+        # size first and more while the file grows
+        output_video_path = uploads.scratch_path('.avi')
+        reserve = uploads.reserve_output(carriers.VIDEO.output_size(input_video_path), output_video_path)
 
-        # Check video capacity
-        cap = cv2.VideoCapture(input_video_path)
-        if not cap.isOpened():
-            os.remove(input_video_path)
-            raise ValueError("Cannot open the video file for capacity check.")
-
-        total_available_bits = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) * \
-                               int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) * \
-                               int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) * 3  # RGB channels
-        cap.release()
-
-        required_bits = len(binary_data)
-        if required_bits > total_available_bits:
-            os.remove(input_video_path)
-            return jsonify({"error": "Binary data is too large to encode in this video."}), 400
-
-        # Prepare output video path
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.avi') as temp_output:
-            output_video_path = temp_output.name
-
-        # Encode the binary data into the video
-        encode_video(input_video_path, binary_data, output_video_path)
+        # Encode the message into a video in the request's scratch directory; it
+        # is encrypted and given its length/CRC header once the clip is opened
+        body = messages.hide(carriers.VIDEO, input_video_path, lambda: messages.seal(text, pending_key, depth),
+                             output_video_path, depth, progress=reserve)
+        reserve()  # The writer flushes its last frames and index on close
 
         # Remove the input temporary file
         os.remove(input_video_path)
 
-        # Prepare video for output
+        # Stream the video in chunks; the file is deleted once the response closes.
+        # AVI headers and index are finalized on close, so streaming starts here.
         logging.info("Video encoding successful.")
-        return send_file(output_video_path, mimetype='video/x-msvideo', as_attachment=True, download_name="encoded_video.avi")
+        return Response(body, mimetype=carriers.VIDEO.output[0],
+                        headers=streams.download_headers(body, "encoded_video.avi"))
 
+    except scratch.ExceedsQuota as e:
+        logging.error(f"Video Encoding error: {e}")
+        return jsonify({"error": str(e)}), 413
+    except scratch.QuotaExceeded as e:
+        logging.error(f"Video Encoding error: {e}")
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
     except Exception as e:
         logging.error(f"Video Encoding error: {e}")
         return jsonify({"error": f"Error encoding the video: {str(e)}"}), 400
@@ -520,40 +215,14 @@ def decode_video_endpoint():
            video_file.filename.rsplit('.', 1)[1].lower() not in ALLOWED_VIDEO_EXTENSIONS:
             return jsonify({"error": "Unsupported video file type"}), 400
 
-        # Save the uploaded video to a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.avi') as temp_input:
-            video_file.save(temp_input.name)
-            input_video_path = temp_input.name
-
-        # Decode binary data from the video
-        delimiter = '10101010101010101010101010101010'  # 32-bit delimiter
-        binary_data = decode_video(input_video_path, delimiter=delimiter)
-
-        # Remove the input temporary file
-        os.remove(input_video_path)
-
-        # Log lengths
-        logging.info(f"Binary data length: {len(binary_data)} bits")
-
-        # Convert binary data back to bytes
-        salted_encrypted_message = binary_to_text(binary_data)
-
-        # Log length
-        logging.info(f"Salted encrypted message length: {len(salted_encrypted_message)} bytes")
-
-        # Extract salt and encrypted message
-        if len(salted_encrypted_message) < 16:
-            raise ValueError("Insufficient data to extract salt.")
-
-        salt = salted_encrypted_message[:16]
-        encrypted_message = salted_encrypted_message[16:]
-
-        # Re-derive the key using the extracted salt
-        fernet_key, _ = process_user_key(user_key, salt)
+        # Media uploads are spooled straight to a named file, so nothing is copied
+        input_video_path = uploads.upload_path(video_file)
 
-        # Decrypt the message
+        # The key is derived as soon as the salt is extracted, while the rest
+        # of the payload is read
         try:
-            hidden_message = decrypt_message(encrypted_message, fernet_key)
+            hidden_message = messages.reveal(carriers.VIDEO, input_video_path, crypto.PendingKey(user_key),
+                                             max_bits=messages.LEGACY_MAX_BITS)
         except InvalidToken:
             raise ValueError("Invalid key or corrupted data")
 
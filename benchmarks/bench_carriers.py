@@ -0,0 +1,137 @@
+"""
+Benchmark every registered carrier through the common Carrier interface.
+
+Writes a synthetic cover for each media type (a PNG image, an FFV1 clip and
+a PCM WAV file), then times ``capacity``, ``embed``, ``extract`` and
+``stream`` of ``stego.carriers`` on it with the same payload, and checks
+that the payload reads back. Each operation reports the best of
+``--repeat`` runs and the payload throughput it implies.
+
+Usage:
+    python -m benchmarks.bench_carriers --payload-bytes 100000 --depth 2
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import wave
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.bench_video import make_clip
+from stego import carriers, lsb, payload
+
+
+def make_image(path, args):
+    """Write a synthetic PNG image of random noise."""
+    rng = np.random.default_rng(0)
+    Image.fromarray(rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8)).save(path)
+
+
+def make_video(path, args):
+    """Write a synthetic FFV1 clip of random noise."""
+    make_clip(path, args.frames, args.frame_width, args.frame_height)
+
+
+def make_audio(path, args):
+    """Write a synthetic 16-bit stereo PCM WAV file of random noise."""
+    rng = np.random.default_rng(0)
+    with wave.open(path, 'wb') as wav_file:
+        wav_file.setnchannels(2)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(44100)
+        wav_file.writeframes(rng.integers(0, 256, args.seconds * 44100 * 4, dtype=np.uint8).tobytes())
+
+
+# Cover writers by carrier kind: (writer, file extension)
+COVERS = {
+    'image': (make_image, 'png'),
+    'video': (make_video, 'avi'),
+    'audio': (make_audio, 'wav'),
+}
+
+
+def best_of(repeat, fn):
+    """Run ``fn`` ``repeat`` times and return (last result, fastest seconds)."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def bench_carrier(carrier, cover_path, message, args, workdir):
+    """Time each operation of one carrier and return (operation, seconds) pairs."""
+    bits = lsb.as_bits(payload.wrap(message, depth=args.depth), args.depth)
+    output_path = os.path.join(workdir, f'encoded.{carrier.output[1]}')
+    results = []
+
+    _, elapsed = best_of(args.repeat, lambda: carrier.capacity(cover_path))
+    results.append(('capacity', elapsed))
+
+    _, elapsed = best_of(args.repeat, lambda: carrier.embed(cover_path, bits, output_path, args.depth,
+                                                            workers=args.workers))
+    results.append(('embed', elapsed))
+
+    extracted, elapsed = best_of(args.repeat, lambda: carrier.extract(output_path, workers=args.workers))
+    if extracted != message:
+        raise RuntimeError(f"The {carrier.kind} carrier did not read back the payload.")
+    results.append(('extract', elapsed))
+
+    def stream():
+        # Streaming may encode the cover in place, so it works on a copy
+        stream_input = os.path.join(workdir, f'stream_input.{COVERS[carrier.kind][1]}')
+        shutil.copyfile(cover_path, stream_input)
+        body = carrier.stream(stream_input, bits, os.path.join(workdir, f'streamed.{carrier.output[1]}'), args.depth)
+        try:
+            return sum(len(piece) for piece in body)
+        finally:
+            if hasattr(body, 'close'):
+                body.close()
+
+    _, elapsed = best_of(args.repeat, stream)
+    results.append(('stream', elapsed))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--payload-bytes', type=int, default=100_000)
+    parser.add_argument('--depth', type=int, default=1, choices=range(1, lsb.MAX_DEPTH + 1))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--kind', action='append', choices=sorted(COVERS),
+                        help="Carrier kind to benchmark; repeat for several (default: all)")
+    parser.add_argument('--width', type=int, default=2048, help="Image width")
+    parser.add_argument('--height', type=int, default=2048, help="Image height")
+    parser.add_argument('--frames', type=int, default=60, help="Video frames")
+    parser.add_argument('--frame-width', type=int, default=640)
+    parser.add_argument('--frame-height', type=int, default=480)
+    parser.add_argument('--seconds', type=int, default=60, help="Audio duration")
+    args = parser.parse_args()
+
+    message = os.urandom(args.payload_bytes)
+    print(f"Payload: {len(message)} bytes at depth {args.depth}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for carrier in carriers.carriers():
+            if carrier.kind not in COVERS or (args.kind and carrier.kind not in args.kind):
+                continue
+            make_cover, extension = COVERS[carrier.kind]
+            cover_path = os.path.join(workdir, f'cover.{extension}')
+            make_cover(cover_path, args)
+
+            _, channel_bytes = carrier.capacity(cover_path)
+            print(f"{carrier.kind}: {os.path.getsize(cover_path) / 1e6:.1f} MB cover, "
+                  f"{channel_bytes * args.depth // 8} bytes capacity")
+            for operation, elapsed in bench_carrier(carrier, cover_path, message, args, workdir):
+                # Capacity reads headers only, so no payload throughput applies
+                rate = f"{len(message) / elapsed / 1e6:9.1f} MB/s" if operation != 'capacity' else ''
+                print(f"  {operation:8s} {elapsed * 1000:9.1f} ms  {rate}")
+
+
+if __name__ == '__main__':
+    main()
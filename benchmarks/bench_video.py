@@ -0,0 +1,110 @@
+"""
+Benchmark the video embedder on a synthetic clip.
+
+Writes a lossless test clip, then times ``stego.video.embed_frames`` on it and
+reports frames per second, both end to end (decode + embed + encode) and for
+the embedding step alone. When PyAV is installed, the stream-copy remux path
+(``stego.video.embed_frames_remux``) is timed as well, and with ``--workers``
+above one so is the process-pool pipeline (``stego.video.embed_frames_parallel``).
+
+Usage:
+    python -m benchmarks.bench_video --frames 60 --payload-bytes 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from stego import lsb, video
+
+
+def make_clip(path, frames, width, height, fps=30):
+    """Write a synthetic FFV1 clip of random noise."""
+    rng = np.random.default_rng(0)
+    out = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'FFV1'), fps, (width, height))
+    if not out.isOpened():
+        raise RuntimeError("FFV1 writer is not available in this OpenCV build.")
+    for _ in range(frames):
+        out.write(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+    out.release()
+
+
+def bench_pipeline(clip_path, output_path, bits, workers=1):
+    """Time a full encode of the clip and return (frames, seconds)."""
+    cap = cv2.VideoCapture(clip_path)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'FFV1'),
+                          cap.get(cv2.CAP_PROP_FPS), (width, height))
+
+    start = time.perf_counter()
+    if workers > 1:
+        video.embed_frames_parallel(clip_path, out, bits, frames, width * height * 3, workers=workers)
+    else:
+        video.embed_frames(cap, out, bits)
+    elapsed = time.perf_counter() - start
+
+    cap.release()
+    out.release()
+    return frames, elapsed
+
+
+def bench_remux(clip_path, output_path, bits):
+    """Time a stream-copy encode of the clip and return seconds."""
+    start = time.perf_counter()
+    video.embed_frames_remux(clip_path, bits, output_path)
+    return time.perf_counter() - start
+
+
+def bench_embed(width, height, bits, repeat=20):
+    """Time the in-memory embedding step alone and return seconds per frame."""
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    flat = frame.reshape(-1)
+    chunk = bits[:flat.size]
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        lsb.embed(flat, chunk)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--frames', type=int, default=60)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--payload-bytes', type=int, default=1_000_000)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    bits = lsb.bits_from_bytes(os.urandom(args.payload_bytes))
+    frame_bits = args.width * args.height * 3
+    print(f"Clip: {args.frames} frames at {args.width}x{args.height}, "
+          f"payload spans {-(-bits.size // frame_bits)} frame(s)")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        clip_path = os.path.join(workdir, 'clip.avi')
+        make_clip(clip_path, args.frames, args.width, args.height)
+
+        frames, elapsed = bench_pipeline(clip_path, os.path.join(workdir, 'out.avi'), bits)
+        print(f"End to end:  {frames / elapsed:8.1f} frames/sec ({elapsed:.2f} s)")
+
+        if video.can_stream_copy(clip_path):
+            elapsed = bench_remux(clip_path, os.path.join(workdir, 'remux.avi'), bits)
+            print(f"Stream copy: {frames / elapsed:8.1f} frames/sec ({elapsed:.2f} s)")
+
+        if args.workers > 1:
+            frames, elapsed = bench_pipeline(clip_path, os.path.join(workdir, 'parallel.avi'),
+                                             bits, workers=args.workers)
+            print(f"{args.workers:2d} workers:  {frames / elapsed:8.1f} frames/sec ({elapsed:.2f} s)")
+
+    per_frame = bench_embed(args.width, args.height, bits)
+    print(f"Embed only:  {1 / per_frame:8.1f} frames/sec ({per_frame * 1000:.2f} ms/frame)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+"""
+Shared steganography engine used by the Flask apps.
+"""
@@ -0,0 +1,318 @@
+"""
+Audio helpers for LSB processing of PCM audio.
+
+Samples are handled as NumPy views over the raw PCM bytes; every byte of
+every sample carries one payload bit, in file order. Uploads that already
+are PCM WAV are read directly; anything else is transcoded in memory.
+
+Files are streamed in fixed-size chunks, so memory stays bounded by
+``CHUNK_FRAMES`` whatever the length of the recording. PCM WAV files are
+memory-mapped instead, so their samples are never copied at all.
+"""
+import io
+import logging
+import os
+import shutil
+import wave
+from contextlib import contextmanager
+
+import numpy as np
+from pydub import AudioSegment
+
+from stego import lsb, mapped, payload, streams
+
+try:
+    import av
+except ImportError:  # PyAV is optional; without it non-WAV files are decoded to probe them
+    av = None
+
+# Audio frames (one sample per channel) read or written per step
+CHUNK_FRAMES = 1 << 16
+
+
+def is_pcm_wav(audio_path):
+    """
+    Check whether a file is a WAV file that ``wave`` can read as-is.
+
+    Args:
+        audio_path (str): Path to the audio file.
+
+    Returns:
+        bool: True for RIFF/WAVE files with PCM sample data.
+    """
+    with open(audio_path, 'rb') as f:
+        riff = f.read(12)
+    if riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+        return False
+    try:
+        # wave only accepts PCM; compressed or float WAVs raise here
+        with wave.open(audio_path, 'rb'):
+            return True
+    except (wave.Error, EOFError):
+        return False
+
+
+def probe(audio_path):
+    """
+    Read an audio file's PCM layout from its headers.
+
+    PCM WAV files report their exact parameters. For other formats the
+    stream metadata is read with PyAV, assuming the 16-bit samples pydub
+    decodes floating-point codecs to; without PyAV the file is decoded.
+
+    Args:
+        audio_path (str): Path to the audio file (any format).
+
+    Returns:
+        tuple: (frame_count, channels, sample_width) of the PCM audio.
+
+    Raises:
+        ValueError: If the audio cannot be read.
+    """
+    if is_pcm_wav(audio_path):
+        with wave.open(audio_path, 'rb') as reader:
+            return reader.getnframes(), reader.getnchannels(), reader.getsampwidth()
+
+    if av is not None:
+        try:
+            with av.open(audio_path) as container:
+                stream = container.streams.audio[0]
+                if stream.duration:
+                    seconds = stream.duration * stream.time_base
+                else:
+                    seconds = (container.duration or 0) / av.time_base
+                float_samples = stream.format.name.rstrip('p') in ('flt', 'dbl')
+                sample_width = 2 if float_samples else stream.format.bytes
+                return int(seconds * stream.rate), stream.channels, sample_width
+        except (av.FFmpegError, IndexError):
+            pass
+
+    with open_pcm(audio_path) as reader:
+        return reader.getnframes(), reader.getnchannels(), reader.getsampwidth()
+
+
+@contextmanager
+def open_pcm(audio_path):
+    """
+    Open an audio file as a PCM ``wave`` reader.
+
+    PCM WAV files are opened directly. Other formats are decoded with pydub
+    into an in-memory WAV, without writing a temporary file.
+
+    Args:
+        audio_path (str): Path to the audio file (any format).
+
+    Yields:
+        wave.Wave_read: Reader over the PCM frames.
+
+    Raises:
+        ValueError: If the audio cannot be decoded.
+    """
+    if is_pcm_wav(audio_path):
+        with wave.open(audio_path, 'rb') as reader:
+            yield reader
+        return
+
+    buffer = io.BytesIO()
+    try:
+        AudioSegment.from_file(audio_path).export(buffer, format="wav")
+    except Exception as e:
+        raise ValueError(f"Error converting audio to WAV: {e}")
+    logging.info(f"Transcoded {audio_path} to PCM in memory.")
+    buffer.seek(0)
+    with wave.open(buffer, 'rb') as reader:
+        yield reader
+
+
+def iter_pcm_chunks(reader, chunk_frames=CHUNK_FRAMES):
+    """
+    Yield the remaining PCM bytes of a ``wave`` reader in fixed-size chunks.
+
+    Args:
+        reader (wave.Wave_read): An opened reader.
+        chunk_frames (int): Audio frames per chunk.
+
+    Yields:
+        bytes: Raw PCM data of up to ``chunk_frames`` whole frames.
+    """
+    frame_size = reader.getnchannels() * reader.getsampwidth()
+    while True:
+        chunk = reader.readframes(chunk_frames)
+        if len(chunk) % frame_size:
+            # A truncated file can end mid-frame
+            chunk = chunk[:len(chunk) - len(chunk) % frame_size]
+        if not chunk:
+            break
+        yield chunk
+
+
+def _embed_chunks(audio_path, bits, output, progress=None, depth=1):
+    """
+    Embed bits chunk by chunk into a WAV written to ``output``.
+
+    Frames are written raw, so the header announced from the input's
+    parameters is never patched and ``output`` need not be seekable.
+    Deferred ``bits`` are resolved once the input is decoded. Yields after
+    every chunk written.
+    """
+    with open_pcm(audio_path) as audio:
+        bits = lsb.as_bits(bits, depth)
+        params = audio.getparams()
+        if not isinstance(output, str) and is_pcm_wav(audio_path):
+            # A truncated file holds fewer frames than its header claims, and a
+            # header already streamed cannot be patched, so size it from the data
+            data_start = 8 + audio.getfp().tell()
+            available = (os.path.getsize(audio_path) - data_start) // (params.nchannels * params.sampwidth)
+            params = params._replace(nframes=min(params.nframes, available))
+        if bits.size > params.nframes * params.nchannels * params.sampwidth:
+            raise ValueError("Binary data is too large to encode in this audio file.")
+
+        with wave.open(output, 'wb') as encoded_audio:
+            encoded_audio.setparams(params)
+            offset = 0
+            written = 0
+            frame_size = params.nchannels * params.sampwidth
+            for chunk in iter_pcm_chunks(audio):
+                if offset < bits.size:
+                    # Writable view over the chunk's PCM bytes
+                    chunk = bytearray(chunk)
+                    samples = np.frombuffer(chunk, dtype=np.uint8)
+                    part = bits[offset:offset + samples.size]
+                    lsb.embed(samples, part, depth)
+                    offset += part.size
+                encoded_audio.writeframesraw(chunk)
+                written += len(chunk) // frame_size
+                if progress is not None:
+                    progress(written)
+                yield
+
+
+def embed_wav(audio_path, bits, output_path, progress=None, depth=1):
+    """
+    Embed bits into an audio file and write the result to a new WAV file.
+
+    PCM WAV inputs are copied as-is and their leading sample LSBs flipped
+    through a memory map of the copy. Other inputs are streamed chunk by
+    chunk: chunks that carry payload get one masked LSB write, and the rest
+    of the file is copied through unchanged.
+
+    Args:
+        audio_path (str): Path to the input audio file (any format).
+        bits (numpy.ndarray | callable): The bits to embed, or a callable
+            returning the payload, called once the input is decoded.
+        output_path (str): Path to save the encoded WAV file.
+        progress (callable, optional): Called with the number of sample frames written so far.
+        depth (int): LSBs written per carrier byte, as ``bits`` were packed with.
+
+    Raises:
+        ValueError: If the bits exceed the audio capacity.
+    """
+    if is_pcm_wav(audio_path):
+        shutil.copyfile(audio_path, output_path)
+        with mapped.MappedWav(output_path, writable=True) as carrier:
+            carrier.embed(lsb.as_bits(bits, depth), depth)
+        if progress is not None:
+            # The mapped write is a single step, so every frame is reported at once
+            progress(probe(output_path)[0])
+        return
+
+    for _ in _embed_chunks(audio_path, bits, output_path, progress, depth):
+        pass
+
+
+def iter_encoded_wav(audio_path, bits, progress=None, depth=1):
+    """
+    Embed bits into an audio file and yield the encoded WAV as it is written.
+
+    Nothing is written to disk; each piece is one chunk of encoded frames,
+    the first one preceded by the WAV header.
+
+    Args:
+        audio_path (str): Path to the input audio file (any format).
+        bits (numpy.ndarray | callable): The bits to embed, or a callable
+            returning the payload, called once the input is decoded.
+        progress (callable, optional): Called with the number of sample frames written so far.
+        depth (int): LSBs written per carrier byte, as ``bits`` were packed with.
+
+    Yields:
+        bytes: Consecutive pieces of the WAV file.
+
+    Raises:
+        ValueError: If the bits exceed the audio capacity.
+    """
+    sink = streams.ChunkSink()
+    for _ in _embed_chunks(audio_path, bits, sink, progress, depth):
+        yield sink.drain()
+    tail = sink.drain()
+    if tail:
+        yield tail
+
+
+def stream_wav(audio_path, bits, depth=1):
+    """
+    Embed bits into an audio file and return the encoded WAV in pieces.
+
+    PCM WAV files are encoded in place, through a memory map, and then sent
+    as they are; anything else is transcoded as it is streamed.
+
+    Args:
+        audio_path (str): Path to the input audio file (any format); PCM WAV
+            files are modified.
+        bits (numpy.ndarray | callable): The bits to embed, or a callable
+            returning the payload, called once the input is decoded.
+        depth (int): LSBs written per carrier byte, as ``bits`` were packed with.
+
+    Returns:
+        iterable: Consecutive pieces of the encoded WAV file.
+
+    Raises:
+        ValueError: If the bits exceed the audio capacity. Raised before the
+            first piece is returned, so no partial response is sent.
+    """
+    if is_pcm_wav(audio_path):
+        with mapped.MappedWav(audio_path, writable=True) as carrier:
+            carrier.embed(lsb.as_bits(bits, depth), depth)
+        logging.info("Audio encoding successful.")
+        return streams.FileChunks(audio_path)
+
+    chunks = iter_encoded_wav(audio_path, bits, depth=depth)
+
+    # Open the input and check capacity now; the input may be removed once
+    # the caller returns, but the open file stays readable
+    first = next(chunks)
+
+    def generate():
+        yield first
+        yield from chunks
+        logging.info("Audio encoding successful.")
+
+    return generate()
+
+
+def read_payload_wav(audio_path, delimiter=None, max_bits=None, on_prefix=None):
+    """
+    Read a payload from the LSBs of an audio file.
+
+    Chunks are read only until the payload is complete; PCM WAV samples
+    are read straight from a memory map of the file.
+
+    Args:
+        audio_path (str): Path to the encoded audio file (any format).
+        delimiter (str, optional): End marker of legacy carriers.
+        max_bits (int, optional): Limit on the legacy delimiter scan.
+        on_prefix (tuple, optional): (size, callback) passed to ``payload.read``.
+
+    Returns:
+        bytes: The extracted payload.
+
+    Raises:
+        ValueError: If no valid payload is found in the audio.
+    """
+    if is_pcm_wav(audio_path):
+        with mapped.MappedWav(audio_path) as carrier:
+            return payload.read(carrier.iter_chunks(), delimiter=delimiter, max_bits=max_bits,
+                                on_prefix=on_prefix)
+
+    with open_pcm(audio_path) as audio:
+        chunks = (np.frombuffer(chunk, dtype=np.uint8) for chunk in iter_pcm_chunks(audio))
+        return payload.read(chunks, delimiter=delimiter, max_bits=max_bits, on_prefix=on_prefix)
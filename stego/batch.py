@@ -0,0 +1,230 @@
+"""
+Helpers for endpoints that process many carriers in one request.
+
+Uploads are read lazily and only a bounded number of carriers is in flight
+at once, so a batch of thousands of files never sits in memory together.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from werkzeug.utils import secure_filename
+
+from stego import streams
+
+# Number of carriers processed concurrently by a batch request
+BATCH_WORKERS = int(os.environ.get('STEGO_BATCH_WORKERS', os.cpu_count() or 1))
+
+# Carriers submitted ahead of the workers, per worker
+PENDING_PER_WORKER = 2
+
+# Size of the pieces a streamed zip archive is flushed in
+ZIP_FLUSH_SIZE = 1 << 16
+
+
+def detach_uploads(files, directory=None):
+    """
+    Copy uploaded files into temporary files owned by the caller.
+
+    The request closes its uploads when the view returns, before a streamed
+    response body is generated; the copies stay readable until closed.
+
+    Args:
+        files (list): Uploaded ``werkzeug.datastructures.FileStorage`` objects.
+        directory (str, optional): Directory for the copies, e.g. the
+            request's scratch directory.
+
+    Returns:
+        list: (filename, file object) tuples.
+    """
+    uploads = []
+    for storage in files:
+        copy = tempfile.TemporaryFile(dir=directory)
+        shutil.copyfileobj(storage.stream, copy)
+        copy.seek(0)
+        uploads.append((storage.filename, copy))
+    return uploads
+
+
+def iter_uploads(uploads):
+    """
+    Yield the carriers of a multipart upload, expanding zip archives.
+
+    Args:
+        uploads (list): (filename, file object) tuples.
+
+    Yields:
+        tuple: (name, data) for every file; members of an archive are named
+        ``archive.zip/member``.
+    """
+    for filename, stream in uploads:
+        if zipfile.is_zipfile(stream):
+            stream.seek(0)
+            with zipfile.ZipFile(stream) as archive:
+                for member in archive.infolist():
+                    if member.is_dir():
+                        continue
+                    yield f"{filename}/{member.filename}", archive.read(member)
+        else:
+            stream.seek(0)
+            yield filename, stream.read()
+
+
+def index_uploads(uploads):
+    """
+    Index the carriers of a multipart upload by name without reading them.
+
+    Args:
+        uploads (list): (filename, file object) tuples.
+
+    Returns:
+        dict: Maps each file name, and the path of each archive member, to a
+        callable returning the file contents.
+    """
+    index = {}
+    for filename, stream in uploads:
+        if zipfile.is_zipfile(stream):
+            stream.seek(0)
+            archive = zipfile.ZipFile(stream)
+            for member in archive.infolist():
+                if not member.is_dir():
+                    index[member.filename] = lambda archive=archive, member=member: archive.read(member)
+        else:
+            def read(stream=stream):
+                stream.seek(0)
+                return stream.read()
+            index[filename] = read
+    return index
+
+
+def map_unordered(executor, fn, items, max_pending):
+    """
+    Apply a function to named items on an executor, in completion order.
+
+    Items are pulled from the iterable only as earlier ones finish, keeping
+    at most ``max_pending`` submitted at a time.
+
+    Args:
+        executor (concurrent.futures.Executor): Executor running ``fn``.
+        fn (callable): Called as ``fn(*args)``.
+        items (iterable): (name, args) tuples.
+        max_pending (int): Maximum number of submitted, unfinished items.
+
+    Yields:
+        tuple: (name, future) for each item as soon as its future is done.
+    """
+    pending = {}
+    for name, args in items:
+        pending[executor.submit(fn, *args)] = name
+        if len(pending) >= max_pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future
+
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    """
+    Return the shared batch process pool, creating it on first use.
+
+    Workers are spawned rather than forked, like the video pools, and are
+    reused across requests so their imports are paid once.
+
+    Returns:
+        concurrent.futures.ProcessPoolExecutor: Pool of ``BATCH_WORKERS`` processes.
+    """
+    global _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS,
+                                                mp_context=multiprocessing.get_context('spawn'))
+        return _process_pool
+
+
+def client_error(error, summary):
+    """
+    Describe a failed carrier to the client without server details.
+
+    ValueErrors raised by the stego modules describe the carrier itself.
+    Anything else, including ValueErrors raised while handling another
+    exception, may carry library details such as scratch paths; only the
+    summary is reported for those, and callers log the full error.
+
+    Args:
+        error (Exception): Why the carrier failed.
+        summary (str): What failed, e.g. "Failed to decode the carrier".
+
+    Returns:
+        str: The message for the client.
+    """
+    if isinstance(error, ValueError) and error.__context__ is None:
+        return f"{summary}: {error}"
+    return f"{summary}."
+
+
+def archive_name(name, taken):
+    """
+    Turn a requested file name into a safe, unique zip member name.
+
+    Directories are dropped and unsafe characters replaced, so no member
+    can be extracted outside the archive's root; names already taken get a
+    numeric suffix.
+
+    Args:
+        name (str): The requested file name.
+        taken (set): Member names used so far; the returned name is added.
+
+    Returns:
+        str: The member name, or None if ``name`` is empty or refers to a
+        parent directory.
+    """
+    parts = name.replace('\\', '/').split('/')
+    if '..' in parts:
+        return None
+    safe = secure_filename(parts[-1])
+    if not safe:
+        return None
+    stem, extension = os.path.splitext(safe)
+    member, suffix = safe, 1
+    while member in taken:
+        member = f"{stem}_{suffix}{extension}"
+        suffix += 1
+    taken.add(member)
+    return member
+
+
+def iter_zip(entries, compression=zipfile.ZIP_STORED):
+    """
+    Stream a zip archive as it is written.
+
+    The sink cannot seek, so ZipFile writes data descriptors after each
+    member and only the current member is ever buffered.
+
+    Args:
+        entries (iterable): (arcname, data) tuples.
+        compression (int): Zip compression method; PNGs are already compressed.
+
+    Yields:
+        bytes: Consecutive pieces of the archive.
+    """
+    sink = streams.ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=compression) as archive:
+        for arcname, data in entries:
+            with archive.open(arcname, 'w') as member:
+                for start in range(0, len(data), ZIP_FLUSH_SIZE):
+                    member.write(data[start:start + ZIP_FLUSH_SIZE])
+                    if len(sink.buffer) >= ZIP_FLUSH_SIZE:
+                        yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
@@ -0,0 +1,428 @@
+"""
+Carrier media types behind one interface, found by MIME sniffing.
+
+Each ``Carrier`` wraps one engine (``raster`` and ``mapped`` for images,
+``video`` for clips, ``audio`` for sound) and offers the same operations:
+``capacity`` from the headers alone, ``embed`` into an output file,
+``extract`` of a payload and ``stream`` of an encoded file as it is
+produced. Every operation takes the path of a carrier file.
+
+Carriers are registered by the MIME types they read. ``detect`` sniffs the
+leading bytes of a file for its type, falls back to its extension, and
+leaves anything else to PIL to identify as an image. ``image_output`` picks
+the image carrier that writes the format a client accepts.
+"""
+import io
+import os
+import shutil
+
+from PIL import Image
+
+from stego import audio, lsb, mapped, payload, raster, streams, video
+
+# Leading bytes of the recognized formats, checked in order: (offset, magic, MIME type)
+SIGNATURES = [
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'II*\x00', 'image/tiff'),
+    (0, b'MM\x00*', 'image/tiff'),
+    (0, b'BM', 'image/bmp'),
+    (0, b'P6', 'image/x-portable-pixmap'),
+    (8, b'WEBP', 'image/webp'),
+    (8, b'AVI ', 'video/x-msvideo'),
+    (8, b'WAVE', 'audio/wav'),
+    (0, b'\x1a\x45\xdf\xa3', 'video/x-matroska'),
+    (4, b'ftypM4A', 'audio/mp4'),
+    (4, b'ftypqt', 'video/quicktime'),
+    (4, b'ftyp', 'video/mp4'),
+    (0, b'fLaC', 'audio/flac'),
+    (0, b'OggS', 'audio/ogg'),
+    (0, b'ID3', 'audio/mpeg'),
+    (0, b'\xff\xf1', 'audio/aac'),
+    (0, b'\xff\xf9', 'audio/aac'),
+    (0, b'\xff\xfb', 'audio/mpeg'),
+    (0, b'\xff\xf3', 'audio/mpeg'),
+    (0, b'\xff\xf2', 'audio/mpeg'),
+]
+
+# Bytes read from the start of a file to sniff its type
+SNIFF_SIZE = 16
+
+
+class Carrier:
+    """
+    One carrier media type.
+
+    Subclasses set ``kind``, the ``mimetypes`` they are registered for, the
+    file ``extensions`` used when sniffing fails, and ``output``, the MIME
+    type and extension of the files they write.
+    """
+
+    kind = None
+    mimetypes = ()
+    extensions = ()
+    output = (None, None)
+
+    def capacity(self, path):
+        """
+        Measure a carrier from its headers, without decoding any sample.
+
+        Args:
+            path (str): Path of the carrier file.
+
+        Returns:
+            tuple: (details, channel_bytes) where ``details`` describes the
+            carrier and ``channel_bytes`` is the number of bytes whose LSBs
+            can be written.
+
+        Raises:
+            ValueError: If the carrier cannot be read.
+        """
+        raise NotImplementedError
+
+    def output_size(self, path):
+        """
+        Estimate the size of the file ``embed`` writes, from the headers alone.
+
+        By default this is the raw size of the channel bytes, which the
+        lossless output formats do not exceed by more than their headers.
+        Carriers whose output can outgrow the estimate report its progress
+        to ``embed``, so callers can reserve space as the file grows.
+
+        Args:
+            path (str): Path of the cover file.
+
+        Returns:
+            int: Expected size of the encoded file in bytes.
+
+        Raises:
+            ValueError: If the carrier cannot be read.
+        """
+        return self.capacity(path)[1]
+
+    def embed(self, path, bits, output_path, depth=1, progress=None, workers=None):
+        """
+        Embed bits into a carrier and write the encoded file.
+
+        Args:
+            path (str): Path of the cover file.
+            bits (numpy.ndarray | callable): The bits to embed, as packed by
+                ``lsb.as_bits``, or a callable returning the payload. It is
+                called once the cover is decoded, so a pending key
+                derivation overlaps with the decode.
+            output_path (str): Path to save the encoded file, in the ``output`` format.
+            depth (int): LSBs written per carrier byte.
+            progress (callable, optional): Called with the amount of work done so far.
+            workers (int, optional): Processes the carrier may use; its
+                default if None. Ignored by single-process carriers.
+
+        Raises:
+            ValueError: If the bits exceed the carrier's capacity.
+        """
+        raise NotImplementedError
+
+    def extract(self, path, delimiter=None, max_bits=None, on_prefix=None, workers=None):
+        """
+        Read a payload from the LSBs of a carrier.
+
+        Args:
+            path (str): Path of the encoded file.
+            delimiter (str, optional): End marker of legacy carriers.
+            max_bits (int, optional): Limit on the legacy delimiter scan.
+            on_prefix (tuple, optional): (size, callback) passed to ``payload.read``.
+            workers (int, optional): Processes the carrier may use; its
+                default if None. Ignored by single-process carriers.
+
+        Returns:
+            bytes: The extracted payload.
+
+        Raises:
+            ValueError: If no valid payload is found.
+        """
+        raise NotImplementedError
+
+    def stream(self, path, bits, output_path, depth=1, progress=None):
+        """
+        Embed bits into a carrier and return the encoded file in pieces.
+
+        By default the file is written to ``output_path`` first and sent
+        from there; carriers that can produce their output as it is encoded
+        leave ``output_path`` unused.
+
+        Args:
+            path (str): Path of the cover file; it may be modified.
+            bits (numpy.ndarray | callable): The bits to embed, as packed by
+                ``lsb.as_bits``, or a callable returning the payload. It is
+                called once the cover is decoded, so a pending key
+                derivation overlaps with the decode.
+            output_path (str): Scratch path the encoded file may be written to,
+                with the extension of the ``output`` format.
+            depth (int): LSBs written per carrier byte.
+            progress (callable, optional): Passed to ``embed`` when the file
+                is written to ``output_path``, e.g. to reserve space as it grows.
+
+        Returns:
+            iterable: Consecutive pieces of the encoded file, in the
+            ``output`` format. Files sent from disk are removed once the
+            iterable is closed.
+
+        Raises:
+            ValueError: If the bits exceed the carrier's capacity. Raised
+                before the first piece is returned.
+        """
+        self.embed(path, bits, output_path, depth, progress=progress)
+        return streams.FileChunks(output_path)
+
+
+class ImageCarrier(Carrier):
+    """Still images; encoded images are written losslessly, as PNG by default."""
+
+    kind = 'image'
+    mimetypes = ('image/png', 'image/jpeg', 'image/gif', 'image/tiff', 'image/bmp',
+                 'image/x-portable-pixmap', 'image/webp')
+    extensions = ('png', 'jpg', 'jpeg', 'gif', 'tif', 'tiff', 'bmp', 'ppm', 'webp')
+
+    def __init__(self, mimetype='image/png', preset=None):
+        """
+        Args:
+            mimetype (str): Output format, one of ``raster.OUTPUT_FORMATS``.
+            preset (str, optional): One of ``raster.OUTPUT_PRESETS``;
+                ``raster.OUTPUT_PRESET`` if None.
+
+        Raises:
+            ValueError: If the output format is not supported.
+        """
+        if mimetype not in raster.OUTPUT_FORMATS:
+            raise ValueError(f"Unsupported output format: {mimetype}")
+        self.output = (mimetype, raster.OUTPUT_FORMATS[mimetype][1])
+        self.preset = preset
+
+    @staticmethod
+    def _open(path):
+        try:
+            return Image.open(path)
+        except OSError as e:
+            raise ValueError(f"Cannot read the image: {e}")
+
+    def _save(self, path, bits, output, depth):
+        with self._open(path) as image:
+            # Decode the cover before waiting for deferred bits
+            image.load()
+            encoded_image = raster.embed(image, lsb.as_bits(bits, depth), depth)
+            raster.save(encoded_image, output, self.output[0], self.preset)
+
+    def capacity(self, path):
+        # Image.open only parses the header; the encoder writes three RGB channels
+        with self._open(path) as image:
+            width, height = image.size
+            return {"type": self.kind, "width": width, "height": height}, raster.capacity(image)
+
+    def embed(self, path, bits, output_path, depth=1, progress=None, workers=None):
+        with open(output_path, 'wb') as output:
+            self._save(path, bits, output, depth)
+
+    def extract(self, path, delimiter=None, max_bits=None, on_prefix=None, workers=None):
+        # Only the rows holding the payload are decoded
+        with self._open(path) as image:
+            return payload.read(raster.iter_chunks(image), delimiter=delimiter, max_bits=max_bits,
+                                on_prefix=on_prefix)
+
+    def stream(self, path, bits, output_path, depth=1, progress=None):
+        # Encoded images are sent from memory, without an output file
+        output = io.BytesIO()
+        self._save(path, bits, output, depth)
+        return [output.getvalue()]
+
+
+class MappedImageCarrier(ImageCarrier):
+    """Uncompressed BMP, PPM and TIFF images, encoded in place and kept in their own format."""
+
+    def __init__(self, image_format):
+        """
+        Args:
+            image_format (str): PIL format of the covers, one of ``mapped.IMAGE_FORMATS``.
+        """
+        self.output = mapped.IMAGE_FORMATS[image_format]
+        self.preset = None
+
+    def _embed_in_place(self, path, bits, depth):
+        with self._open(path) as image:
+            layout = mapped.image_layout(image)
+            if layout is None:
+                raise ValueError("The image cannot be encoded in place.")
+            with mapped.MappedImage(path, image, layout, writable=True) as carrier:
+                carrier.embed(lsb.as_bits(bits, depth), depth)
+
+    def embed(self, path, bits, output_path, depth=1, progress=None, workers=None):
+        shutil.copyfile(path, output_path)
+        self._embed_in_place(output_path, bits, depth)
+
+    def stream(self, path, bits, output_path, depth=1, progress=None):
+        # The LSBs are flipped through a memory map of the cover, which is sent as it is
+        self._embed_in_place(path, bits, depth)
+        return streams.FileChunks(path)
+
+
+class VideoCarrier(Carrier):
+    """Video clips; encoded clips are written as lossless FFV1 in AVI."""
+
+    kind = 'video'
+    mimetypes = ('video/x-msvideo', 'video/mp4', 'video/quicktime', 'video/x-matroska')
+    extensions = ('avi', 'mp4', 'mov', 'mkv')
+    output = ('video/x-msvideo', 'avi')
+
+    def __init__(self, workers=video.DEFAULT_WORKERS, stream_copy=True):
+        """
+        Args:
+            workers (int): Default number of processes per clip.
+            stream_copy (bool): Remux clips whose codec allows it instead of
+                re-encoding every frame.
+        """
+        self.workers = workers
+        self.stream_copy = stream_copy
+
+    def capacity(self, path):
+        frame_count, width, height, fps = video.probe(path)
+        details = {"type": self.kind, "frames": frame_count, "width": width, "height": height, "fps": fps}
+        return details, frame_count * width * height * 3
+
+    def output_size(self, path):
+        # Remuxed clips keep their lossless packets; anything else becomes FFV1,
+        # which compresses most footage well below the raw frames
+        if self.stream_copy and video.can_stream_copy(path):
+            return os.path.getsize(path)
+        return int(super().output_size(path) * video.FFV1_RATIO)
+
+    def embed(self, path, bits, output_path, depth=1, progress=None, workers=None):
+        video.encode(path, lsb.as_bits(bits, depth), output_path, stream_copy=self.stream_copy, workers=workers or self.workers,
+                     progress=progress, depth=depth)
+
+    def extract(self, path, delimiter=None, max_bits=None, on_prefix=None, workers=None):
+        return video.read_payload(path, delimiter=delimiter, max_bits=max_bits, on_prefix=on_prefix,
+                                  workers=workers or self.workers)
+
+
+class AudioCarrier(Carrier):
+    """Audio files of any format pydub reads; encoded audio is written as PCM WAV."""
+
+    kind = 'audio'
+    mimetypes = ('audio/wav', 'audio/mpeg', 'audio/flac', 'audio/ogg', 'audio/mp4', 'audio/aac')
+    extensions = ('wav', 'mp3', 'flac', 'ogg', 'm4a', 'aac')
+    output = ('audio/wav', 'wav')
+
+    def capacity(self, path):
+        frame_count, channels, sample_width = audio.probe(path)
+        details = {"type": self.kind, "frames": frame_count, "channels": channels, "sample_width": sample_width}
+        return details, frame_count * channels * sample_width
+
+    def embed(self, path, bits, output_path, depth=1, progress=None, workers=None):
+        audio.embed_wav(path, bits, output_path, progress=progress, depth=depth)
+
+    def extract(self, path, delimiter=None, max_bits=None, on_prefix=None, workers=None):
+        return audio.read_payload_wav(path, delimiter=delimiter, max_bits=max_bits, on_prefix=on_prefix)
+
+    def stream(self, path, bits, output_path, depth=1, progress=None):
+        # PCM WAV is encoded in place and other formats as they are sent
+        return audio.stream_wav(path, bits, depth)
+
+
+# Registered carriers by MIME type
+REGISTRY = {}
+
+
+def register(carrier):
+    """
+    Register a carrier for each of its MIME types.
+
+    Args:
+        carrier (Carrier): The carrier; later registrations of a MIME type win.
+
+    Returns:
+        Carrier: The carrier, so it can be kept in a module constant.
+    """
+    for mimetype in carrier.mimetypes:
+        REGISTRY[mimetype] = carrier
+    return carrier
+
+
+IMAGE = register(ImageCarrier())
+VIDEO = register(VideoCarrier())
+AUDIO = register(AudioCarrier())
+
+
+def carriers():
+    """
+    Returns:
+        list: Every registered carrier, once each, in registration order.
+    """
+    return list(dict.fromkeys(REGISTRY.values()))
+
+
+def image_output(path, accept, preset=None):
+    """
+    Pick the image carrier that writes a cover in a format the client accepts.
+
+    Args:
+        path (str): Path of the cover image.
+        accept (werkzeug.datastructures.MIMEAccept): The accepted MIME types.
+        preset (str, optional): Encoder preset for re-encoded images.
+
+    Returns:
+        ImageCarrier: A ``MappedImageCarrier`` if the cover is uncompressed
+        and the client names its format, or an ``ImageCarrier`` writing the
+        negotiated lossless format, PNG by default.
+
+    Raises:
+        ValueError: If the image cannot be read.
+    """
+    with ImageCarrier._open(path) as image:
+        layout = mapped.image_layout(image)
+        image_format = image.format
+    cover_mimetype = mapped.IMAGE_FORMATS[image_format][0] if layout is not None else None
+    mimetype, in_place = raster.negotiate(accept, cover_mimetype)
+    if in_place:
+        return MappedImageCarrier(image_format)
+    return ImageCarrier(mimetype, preset)
+
+
+def sniff(head):
+    """
+    Identify a file's format from its leading bytes.
+
+    Args:
+        head (bytes): At least the first ``SNIFF_SIZE`` bytes of the file.
+
+    Returns:
+        str: The MIME type, or None if no signature matches.
+    """
+    for offset, magic, mimetype in SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            return mimetype
+    return None
+
+
+def detect(path, filename=None):
+    """
+    Find the carrier that reads a file.
+
+    Args:
+        path (str): Path of the file.
+        filename (str, optional): Original file name, whose extension is
+            used if the contents are not recognized; ``path`` otherwise.
+
+    Returns:
+        Carrier: The registered carrier for the file's MIME type or
+        extension, or ``IMAGE`` for anything else, which PIL may still read.
+    """
+    with open(path, 'rb') as f:
+        mimetype = sniff(f.read(SNIFF_SIZE))
+    if mimetype in REGISTRY:
+        return REGISTRY[mimetype]
+
+    extension = os.path.splitext(filename or path)[1].lower().lstrip('.')
+    for carrier in carriers():
+        if extension in carrier.extensions:
+            return carrier
+    return IMAGE
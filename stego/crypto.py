@@ -0,0 +1,387 @@
+"""
+Key derivation for the Fernet-encrypted payloads.
+
+PBKDF2 is deliberately slow, so derived keys are kept in a small in-process
+cache. Entries are indexed by a digest of (password, salt, iterations) and
+never store the password itself.
+
+Derivations can also run on a dedicated executor, so endpoints can start
+them early and keep reading the upload while the key is being derived.
+"""
+import base64
+import hashlib
+import multiprocessing
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+
+# PBKDF2 iterations used for every payload key
+KDF_ITERATIONS = 100_000
+
+# Maximum number of derived keys kept in memory
+KEY_CACHE_SIZE = int(os.environ.get('STEGO_KEY_CACHE_SIZE', 256))
+
+# Seconds a derived key stays usable after it was cached
+KEY_CACHE_TTL = float(os.environ.get('STEGO_KEY_CACHE_TTL', 300))
+
+# Executor for key derivation: 'thread' (cryptography releases the GIL) or 'process'
+CRYPTO_EXECUTOR = os.environ.get('STEGO_CRYPTO_EXECUTOR', 'thread')
+
+# Number of workers in the crypto executor
+CRYPTO_WORKERS = int(os.environ.get('STEGO_CRYPTO_WORKERS', os.cpu_count() or 1))
+
+# Size of the random salt stored in front of each ciphertext
+SALT_SIZE = 16
+
+# Fernet token overhead: version, timestamp, IV and HMAC
+FERNET_OVERHEAD = 1 + 8 + 16 + 32
+
+# Fernet pads plaintexts to whole AES blocks
+FERNET_BLOCK = 16
+
+
+def _zeroize(buffer):
+    buffer[:] = bytes(len(buffer))
+
+
+class KeyCache:
+    """
+    Thread-safe LRU cache of derived keys with a time-to-live.
+
+    Keys are held in mutable buffers that are overwritten with zeros when
+    they are evicted, expire or are replaced. Callers receive copies.
+    """
+
+    def __init__(self, max_entries=KEY_CACHE_SIZE, ttl=KEY_CACHE_TTL):
+        """
+        Args:
+            max_entries (int): Maximum number of keys kept.
+            ttl (float): Seconds an entry stays valid.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(user_key, salt, iterations):
+        """
+        Compute the cache index for a derivation.
+
+        Args:
+            user_key (str): The user's secret key/password.
+            salt (bytes): The derivation salt.
+            iterations (int): The PBKDF2 iteration count.
+
+        Returns:
+            bytes: SHA-256 digest of the length-prefixed inputs.
+        """
+        password = user_key.encode()
+        return hashlib.sha256(
+            struct.pack('>IIQ', len(password), len(salt), iterations) + password + salt
+        ).digest()
+
+    def get(self, digest):
+        """
+        Look up a derived key.
+
+        Args:
+            digest (bytes): Index from ``KeyCache.digest``.
+
+        Returns:
+            bytes: A copy of the key, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry[1] < time.monotonic():
+                del self._entries[digest]
+                _zeroize(entry[0])
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return bytes(entry[0])
+
+    def put(self, digest, key):
+        """
+        Store a derived key, dropping expired entries and evicting the least
+        recently used ones if full.
+
+        Args:
+            digest (bytes): Index from ``KeyCache.digest``.
+            key (bytes): The derived key.
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            previous = self._entries.pop(digest, None)
+            if previous is not None:
+                _zeroize(previous[0])
+            now = time.monotonic()
+            for stale in [d for d, (_, expires) in self._entries.items() if expires < now]:
+                _zeroize(self._entries.pop(stale)[0])
+            self._entries[digest] = (bytearray(key), now + self.ttl)
+            while len(self._entries) > self.max_entries:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                _zeroize(evicted)
+
+    def clear(self):
+        """Zeroize and drop every cached key."""
+        with self._lock:
+            for buffer, _ in self._entries.values():
+                _zeroize(buffer)
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Report cache counters.
+
+        Returns:
+            dict: Hit and miss counts and the current number of entries.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+KEY_CACHE = KeyCache()
+
+
+def _pbkdf2(user_key, salt, iterations):
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),      # Use SHA256 for the hashing algorithm
+        length=32,                      # Fernet requires a 32-byte key
+        salt=salt,
+        iterations=iterations,
+        backend=default_backend()
+    )
+    return base64.urlsafe_b64encode(kdf.derive(user_key.encode()))
+
+
+def derive_key(user_key, salt, iterations=KDF_ITERATIONS, cache=KEY_CACHE):
+    """
+    Derive a Fernet key from a password with PBKDF2-HMAC-SHA256.
+
+    Args:
+        user_key (str): The user's secret key/password.
+        salt (bytes): Salt for key derivation.
+        iterations (int): Number of PBKDF2 iterations.
+        cache (KeyCache, optional): Cache to consult and fill; None disables it.
+
+    Returns:
+        bytes: The URL-safe base64-encoded 32-byte key.
+    """
+    digest = None
+    if cache is not None:
+        digest = KeyCache.digest(user_key, salt, iterations)
+        key = cache.get(digest)
+        if key is not None:
+            return key
+
+    key = _pbkdf2(user_key, salt, iterations)
+
+    if cache is not None:
+        cache.put(digest, key)
+    return key
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Return the shared crypto executor, creating it on first use.
+
+    Returns:
+        concurrent.futures.Executor: A thread or process pool, as set by
+        ``CRYPTO_EXECUTOR``.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            if CRYPTO_EXECUTOR == 'process':
+                # Forking a multithreaded server can copy held locks into the children
+                _executor = ProcessPoolExecutor(max_workers=CRYPTO_WORKERS,
+                                                mp_context=multiprocessing.get_context('spawn'))
+            else:
+                _executor = ThreadPoolExecutor(max_workers=CRYPTO_WORKERS,
+                                               thread_name_prefix='stego-crypto')
+        return _executor
+
+
+def submit_derive_key(user_key, salt, iterations=KDF_ITERATIONS, cache=KEY_CACHE):
+    """
+    Derive a key on the crypto executor.
+
+    Cache hits resolve immediately without touching the executor; misses
+    fill the cache from the calling process once the derivation finishes.
+
+    Args:
+        user_key (str): The user's secret key/password.
+        salt (bytes): Salt for key derivation.
+        iterations (int): Number of PBKDF2 iterations.
+        cache (KeyCache, optional): Cache to consult and fill; None disables it.
+
+    Returns:
+        concurrent.futures.Future: Resolves to the derived key.
+    """
+    if cache is not None:
+        digest = KeyCache.digest(user_key, salt, iterations)
+        key = cache.get(digest)
+        if key is not None:
+            future = Future()
+            future.set_result(key)
+            return future
+
+    future = get_executor().submit(_pbkdf2, user_key, salt, iterations)
+    if cache is not None:
+        def fill_cache(done):
+            if done.exception() is None:
+                cache.put(digest, done.result())
+        future.add_done_callback(fill_cache)
+    return future
+
+
+class PendingKey:
+    """
+    A key derivation started as soon as its salt is known.
+
+    Encoders start it with a fresh salt before reading the upload; decoders
+    pass ``start`` as the payload prefix callback so derivation overlaps
+    with extracting the rest of the ciphertext.
+    """
+
+    def __init__(self, user_key):
+        """
+        Args:
+            user_key (str): The user's secret key/password.
+        """
+        self.user_key = user_key
+        self.salt = None
+        self._future = None
+
+    def start(self, salt=None):
+        """
+        Submit the derivation.
+
+        Args:
+            salt (bytes, optional): Salt read from a carrier. A fresh random
+                salt is generated (and not cached) if None.
+
+        Returns:
+            bytes: The salt in use.
+        """
+        if salt is None:
+            self.salt = os.urandom(SALT_SIZE)
+            self._future = submit_derive_key(self.user_key, self.salt, cache=None)
+        else:
+            self.salt = bytes(salt)
+            self._future = submit_derive_key(self.user_key, self.salt)
+        return self.salt
+
+    def result(self, salt=None):
+        """
+        Wait for the derived key.
+
+        Args:
+            salt (bytes, optional): The salt the key must belong to; the
+                derivation is (re)started if it was not started for it.
+
+        Returns:
+            bytes: The derived key.
+        """
+        if self._future is None or (salt is not None and bytes(salt) != self.salt):
+            self.start(salt)
+        return self._future.result()
+
+
+class KeyRing:
+    """
+    Key derivations for one password shared across many carriers.
+
+    Each distinct salt is submitted to the crypto executor once; carriers
+    that share a salt wait on the same derivation, even when they are
+    decoded concurrently.
+    """
+
+    def __init__(self, user_key):
+        """
+        Args:
+            user_key (str): The user's secret key/password.
+        """
+        self.user_key = user_key
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._futures)
+
+    def start(self, salt):
+        """
+        Submit the derivation for a salt unless it was already started.
+
+        Args:
+            salt (bytes): Salt read from a carrier.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the derived key.
+        """
+        salt = bytes(salt)
+        with self._lock:
+            future = self._futures.get(salt)
+            if future is None:
+                future = self._futures[salt] = submit_derive_key(self.user_key, salt)
+            return future
+
+    def result(self, salt):
+        """
+        Wait for the key derived for a salt.
+
+        Args:
+            salt (bytes): Salt read from a carrier.
+
+        Returns:
+            bytes: The derived key.
+        """
+        return self.start(salt).result()
+
+
+def sealed_size(message_size):
+    """
+    Size of the salted Fernet token a message is embedded as.
+
+    Args:
+        message_size (int): Length of the UTF-8 encoded message.
+
+    Returns:
+        int: Bytes of salt and base64 token.
+    """
+    raw = FERNET_OVERHEAD + (message_size // FERNET_BLOCK + 1) * FERNET_BLOCK
+    return SALT_SIZE + 4 * -(-raw // 3)
+
+
+def max_message_size(sealed_size):
+    """
+    Longest message whose salted Fernet token fits in a number of bytes.
+
+    Args:
+        sealed_size (int): Bytes available for salt and token.
+
+    Returns:
+        int: Maximum UTF-8 message length, or -1 if not even an empty message fits.
+    """
+    raw = (sealed_size - SALT_SIZE) // 4 * 3
+    blocks = (raw - FERNET_OVERHEAD) // FERNET_BLOCK
+    return max(blocks * FERNET_BLOCK - 1, -1)
@@ -0,0 +1,335 @@
+"""
+Background jobs for long-running encodes.
+
+Jobs are recorded in a SQLite database next to their files, so any request
+thread can report their status and queued jobs survive a restart. Worker
+threads claim queued jobs one at a time and run the handler registered for
+the job's kind.
+
+Several processes may share the jobs directory. Each running job records
+the process that claimed it and a heartbeat that process keeps fresh; only
+jobs whose heartbeat has gone stale, because their process died, are
+queued again.
+
+The files of all jobs share a quota, recorded per job in the database so
+every process sees it: a job reserves its input, payload and expected
+output when it is queued, more if its output outgrows that, and keeps its
+result's share until it expires.
+"""
+import json
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import closing
+
+from stego import scratch
+
+# Directory holding the job database and one subdirectory per job
+JOBS_DIR = os.environ.get('STEGO_JOBS_DIR', os.path.join(tempfile.gettempdir(), 'stego-jobs'))
+
+# Bytes the files of all unexpired jobs together may take
+JOBS_QUOTA = int(os.environ.get('STEGO_JOBS_QUOTA', 8 << 30))
+
+# Number of jobs run concurrently
+JOB_WORKERS = int(os.environ.get('STEGO_JOB_WORKERS', 1))
+
+# Seconds a finished job and its result are kept
+JOB_TTL = float(os.environ.get('STEGO_JOB_TTL', 24 * 3600))
+
+# Minimum seconds between two progress writes of a running job
+PROGRESS_INTERVAL = 0.5
+
+# Seconds an idle worker waits before checking the queue again
+POLL_INTERVAL = 1.0
+
+# Seconds between two heartbeats of the jobs a process is running
+HEARTBEAT_INTERVAL = 10.0
+
+# Seconds without a heartbeat after which a running job is queued again
+HEARTBEAT_TIMEOUT = float(os.environ.get('STEGO_JOB_HEARTBEAT_TIMEOUT', 60))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    state TEXT NOT NULL,
+    params TEXT NOT NULL,
+    progress INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,
+    unit TEXT,
+    result TEXT,
+    error TEXT,
+    owner TEXT,
+    heartbeat REAL,
+    reserved INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+# Columns added after the first schema, for databases created before them
+_MIGRATIONS = {
+    'owner': "ALTER TABLE jobs ADD COLUMN owner TEXT",
+    'heartbeat': "ALTER TABLE jobs ADD COLUMN heartbeat REAL",
+    'reserved': "ALTER TABLE jobs ADD COLUMN reserved INTEGER NOT NULL DEFAULT 0",
+}
+
+
+def _dir_size(path):
+    """Return the bytes taken by the files directly in a directory."""
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+
+class JobQueue:
+    """
+    A SQLite-backed queue of jobs run by background threads.
+
+    Handlers are called as ``handler(job, progress)`` where ``job`` is a dict
+    with the job's ``id``, ``params``, ``dir`` and ``files``, and
+    ``progress(done)`` records how much work is finished. A handler returns
+    the path of its result file inside the job directory.
+
+    Workers start on first use, along with a thread that refreshes the
+    heartbeat of the jobs this process runs. A running job whose heartbeat
+    is older than ``HEARTBEAT_TIMEOUT`` was cut off by a crash or restart
+    and is queued again by the next worker looking for work, in any process.
+    """
+
+    def __init__(self, handlers, directory=JOBS_DIR, workers=JOB_WORKERS, ttl=JOB_TTL, quota=JOBS_QUOTA):
+        """
+        Args:
+            handlers (dict): Maps job kinds to handler callables.
+            directory (str): Directory for the database and job files.
+            workers (int): Number of worker threads.
+            ttl (float): Seconds finished jobs are kept.
+            quota (int): Bytes the files of all jobs may take together.
+        """
+        self.handlers = handlers
+        self.directory = directory
+        self.workers = workers
+        self.ttl = ttl
+        self.quota = quota
+        self.db_path = os.path.join(directory, 'jobs.sqlite3')
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._started = False
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def start(self):
+        """Create the database and start the worker threads, once."""
+        with self._lock:
+            if self._started:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            with closing(self._connect()) as connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(_SCHEMA)
+                columns = {row['name'] for row in connection.execute("PRAGMA table_info(jobs)")}
+                for column, statement in _MIGRATIONS.items():
+                    if column not in columns:
+                        connection.execute(statement)
+            for index in range(self.workers):
+                threading.Thread(target=self._work, name=f'stego-job-{index}', daemon=True).start()
+            threading.Thread(target=self._beat, name='stego-job-heartbeat', daemon=True).start()
+            self._started = True
+
+    def job_dir(self, job_id):
+        """
+        Args:
+            job_id (str): The job id.
+
+        Returns:
+            str: Directory holding the job's files.
+        """
+        return os.path.join(self.directory, job_id)
+
+    def submit(self, kind, params, files, total=None, unit=None, output_size=0):
+        """
+        Queue a job.
+
+        Args:
+            kind (str): Handler to run.
+            params (dict): JSON-serializable job parameters.
+            files (dict): Maps names to paths of files moved into the job directory.
+            total (int, optional): Amount of work, if known in advance.
+            unit (str, optional): What ``progress`` and ``total`` count.
+            output_size (int): Expected size of the job's result file.
+
+        Returns:
+            str: The new job id.
+
+        Raises:
+            ValueError: If no handler is registered for ``kind``.
+            scratch.ExceedsQuota: If the job's files are larger than the whole quota.
+            scratch.QuotaExceeded: If unexpired jobs hold too much of the quota.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        reserved = sum(os.path.getsize(path) for path in files.values()) + output_size
+        if reserved > self.quota:
+            raise scratch.ExceedsQuota("The job is larger than the available job storage.")
+        self.start()
+
+        job_id = uuid.uuid4().hex
+        job_dir = self.job_dir(job_id)
+        os.makedirs(job_dir)
+        moved = {}
+        for name, path in files.items():
+            moved[name] = os.path.join(job_dir, name + os.path.splitext(path)[1])
+            shutil.move(path, moved[name])
+
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            used = connection.execute("SELECT COALESCE(SUM(reserved), 0) FROM jobs").fetchone()[0]
+            if used + reserved > self.quota:
+                connection.execute("ROLLBACK")
+                shutil.rmtree(job_dir, ignore_errors=True)
+                raise scratch.QuotaExceeded("Job storage is full; try again later.")
+            connection.execute(
+                "INSERT INTO jobs (id, kind, state, params, total, unit, reserved, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps({"params": params, "files": moved}), total, unit, reserved,
+                 now, now))
+            connection.execute("COMMIT")
+        self._wakeup.set()
+        logging.info(f"Queued {kind} job {job_id}.")
+        return job_id
+
+    def get(self, job_id):
+        """
+        Look up a job.
+
+        Args:
+            job_id (str): The job id.
+
+        Returns:
+            dict: The job's state, progress, parameters and result path, or
+            None if it does not exist.
+        """
+        self.start()
+        with closing(self._connect()) as connection:
+            row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job.update(json.loads(job['params']))
+        job['dir'] = self.job_dir(job_id)
+        return job
+
+    def _claim(self):
+        now = time.time()
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            # Jobs whose process stopped beating were cut off; run them again
+            stale = connection.execute(
+                "UPDATE jobs SET state = ?, progress = 0, owner = NULL, updated = ? "
+                "WHERE state = ? AND COALESCE(heartbeat, updated) < ?",
+                (QUEUED, now, RUNNING, now - HEARTBEAT_TIMEOUT)).rowcount
+            if stale:
+                logging.info(f"Requeued {stale} job(s) with a stale heartbeat.")
+            row = connection.execute("SELECT id FROM jobs WHERE state = ? ORDER BY created LIMIT 1",
+                                     (QUEUED,)).fetchone()
+            if row is not None:
+                connection.execute("UPDATE jobs SET state = ?, owner = ?, heartbeat = ?, updated = ? WHERE id = ?",
+                                   (RUNNING, self.owner, now, now, row['id']))
+            connection.execute("COMMIT")
+        return None if row is None else self.get(row['id'])
+
+    def _update(self, job_id, **fields):
+        # A job requeued after a stale heartbeat belongs to its new owner
+        fields['updated'] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with closing(self._connect()) as connection:
+            connection.execute(f"UPDATE jobs SET {assignments} WHERE id = ? AND owner = ?",
+                               (*fields.values(), job_id, self.owner))
+
+    def _reserve(self, job_id, nbytes):
+        # Grow a running job's share when its output outgrows the estimate
+        with closing(self._connect()) as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            used = connection.execute("SELECT COALESCE(SUM(reserved), 0) FROM jobs").fetchone()[0]
+            if used + nbytes > self.quota:
+                connection.execute("ROLLBACK")
+                raise scratch.QuotaExceeded("Job storage is full.")
+            connection.execute("UPDATE jobs SET reserved = reserved + ? WHERE id = ?", (nbytes, job_id))
+            connection.execute("COMMIT")
+
+    def _beat(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            try:
+                with closing(self._connect()) as connection:
+                    connection.execute("UPDATE jobs SET heartbeat = ? WHERE state = ? AND owner = ?",
+                                       (time.time(), RUNNING, self.owner))
+            except sqlite3.Error as e:
+                logging.error(f"Job heartbeat error: {e}")
+
+    def _run(self, job):
+        last_write = 0.0
+        reserved = job['reserved']
+
+        def progress(done):
+            nonlocal last_write, reserved
+            now = time.monotonic()
+            if now - last_write >= PROGRESS_INTERVAL:
+                last_write = now
+                size = _dir_size(job['dir'])
+                if size > reserved:
+                    self._reserve(job['id'], size - reserved)
+                    reserved = size
+                self._update(job['id'], progress=done)
+
+        try:
+            result = self.handlers[job['kind']](job, progress)
+        except Exception as e:
+            logging.error(f"Job {job['id']} failed: {e}")
+            self._update(job['id'], state=FAILED, error=str(e), reserved=_dir_size(job['dir']))
+            return
+        # Only the result is kept; its actual size is what the job holds now
+        with closing(self._connect()) as connection:
+            connection.execute("UPDATE jobs SET state = ?, result = ?, progress = COALESCE(total, progress), "
+                               "reserved = ?, updated = ? WHERE id = ? AND owner = ?",
+                               (DONE, result, _dir_size(job['dir']), time.time(), job['id'], self.owner))
+        logging.info(f"Job {job['id']} finished.")
+
+    def purge(self):
+        """Delete finished jobs older than the TTL, with their files."""
+        cutoff = time.time() - self.ttl
+        with closing(self._connect()) as connection:
+            expired = [row['id'] for row in connection.execute(
+                "SELECT id FROM jobs WHERE state IN (?, ?) AND updated < ?", (DONE, FAILED, cutoff))]
+            for job_id in expired:
+                connection.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        for job_id in expired:
+            shutil.rmtree(self.job_dir(job_id), ignore_errors=True)
+
+    def _work(self):
+        while True:
+            try:
+                job = self._claim()
+                if job is None:
+                    self.purge()
+                    self._wakeup.wait(POLL_INTERVAL)
+                    self._wakeup.clear()
+                    continue
+                self._run(job)
+            except Exception as e:
+                logging.error(f"Job worker error: {e}")
+                time.sleep(POLL_INTERVAL)
@@ -0,0 +1,325 @@
+"""
+Vectorized least-significant-bit engine.
+
+Carriers are handled as flat ``uint8`` NumPy arrays and payloads as arrays
+holding one bit (0 or 1) per element, most significant bit first.
+
+Payloads can also be embedded ``depth`` bits per carrier byte, in its low
+bit planes; they are then packed into one ``depth``-bit value per element.
+"""
+import numpy as np
+
+# Number of carrier bytes scanned per step when searching for a delimiter
+CHUNK_SIZE = 1 << 20
+
+# Most LSBs written per carrier byte
+MAX_DEPTH = 4
+
+
+def bits_from_bytes(data):
+    """
+    Unpack bytes into an array of bits.
+
+    Args:
+        data (bytes): The data to unpack.
+
+    Returns:
+        numpy.ndarray: ``uint8`` array with one bit per element.
+    """
+    return np.unpackbits(np.frombuffer(data, dtype=np.uint8))
+
+
+def bits_from_string(binary_data):
+    """
+    Convert a '0'/'1' string to an array of bits.
+
+    Args:
+        binary_data (str): The binary string to convert.
+
+    Returns:
+        numpy.ndarray: ``uint8`` array with one bit per element.
+
+    Raises:
+        ValueError: If the string contains characters other than '0' and '1'.
+    """
+    bits = np.frombuffer(binary_data.encode('ascii'), dtype=np.uint8) - ord('0')
+    if bits.size and bits.max() > 1:
+        raise ValueError("Binary data must only contain '0' and '1'.")
+    return bits
+
+
+def as_bits(data, depth=1):
+    """
+    Coerce a payload to an array of bits.
+
+    Args:
+        data (bytes | str | numpy.ndarray | callable): Payload bytes, a legacy
+            '0'/'1' string, an existing bit array (returned unchanged), or a
+            callable returning one of these, called now.
+        depth (int): Bits per carrier byte; the bits are packed with ``pack``.
+
+    Returns:
+        numpy.ndarray: ``uint8`` array with one carrier byte's bits per element.
+    """
+    if callable(data):
+        data = data()
+    if isinstance(data, np.ndarray):
+        return data
+    if isinstance(data, str):
+        return pack(bits_from_string(data), depth)
+    return pack(bits_from_bytes(data), depth)
+
+
+def parse_depth(value):
+    """
+    Validate a requested embedding depth.
+
+    Args:
+        value (str | int | None): LSBs per carrier byte; None means 1.
+
+    Returns:
+        int: The depth.
+
+    Raises:
+        ValueError: If the depth is not an integer from 1 to ``MAX_DEPTH``.
+    """
+    if value is None or value == '':
+        return 1
+    try:
+        depth = int(value)
+    except (TypeError, ValueError):
+        depth = 0
+    if not 1 <= depth <= MAX_DEPTH:
+        raise ValueError(f"Depth must be an integer from 1 to {MAX_DEPTH}.")
+    return depth
+
+
+def pack(bits, depth):
+    """
+    Group bits into one value per carrier byte.
+
+    Args:
+        bits (numpy.ndarray): The bits to pack, one per element.
+        depth (int): Bits per value, most significant first; the last value
+            is padded with zeros.
+
+    Returns:
+        numpy.ndarray: ``uint8`` array of ``depth``-bit values.
+    """
+    if depth == 1:
+        return bits
+    padding = -bits.size % depth
+    if padding:
+        bits = np.concatenate((bits, np.zeros(padding, dtype=np.uint8)))
+    return np.packbits(bits.reshape(-1, depth), axis=1).reshape(-1) >> (8 - depth)
+
+
+def unpack(carrier, depth):
+    """
+    Read the low ``depth`` bits of each carrier byte.
+
+    Args:
+        carrier (numpy.ndarray): Flat ``uint8`` carrier bytes.
+        depth (int): LSBs per carrier byte.
+
+    Returns:
+        numpy.ndarray: ``uint8`` array with one bit per element, most
+        significant first within each carrier byte.
+    """
+    if depth == 1:
+        return carrier & 1
+    shifted = np.left_shift(carrier, 8 - depth).astype(np.uint8)
+    return np.unpackbits(shifted.reshape(-1, 1), axis=1, count=depth).reshape(-1)
+
+
+def text_to_binary(data):
+    """
+    Convert bytes to a '0'/'1' string.
+
+    Kept for callers of the string API; the engine itself works on bytes.
+
+    Args:
+        data (bytes): The data to convert.
+
+    Returns:
+        str: The binary string representation.
+    """
+    return (bits_from_bytes(data) + ord('0')).tobytes().decode('ascii')
+
+
+def binary_to_text(binary_string):
+    """
+    Convert a '0'/'1' string to bytes, dropping any trailing partial byte.
+
+    Args:
+        binary_string (str): The binary string to convert.
+
+    Returns:
+        bytes: The resulting bytes data.
+    """
+    return bits_to_bytes(bits_from_string(binary_string))
+
+
+def embed(carrier, bits, depth=1):
+    """
+    Write bits into the LSBs of the leading carrier bytes, in place.
+
+    Only the first ``len(bits)`` bytes of the carrier are touched.
+
+    Args:
+        carrier (numpy.ndarray): Flat, writable ``uint8`` array.
+        bits (numpy.ndarray): The bits to embed, as packed by ``as_bits``.
+        depth (int): LSBs replaced in each carrier byte.
+
+    Raises:
+        ValueError: If the bits do not fit in the carrier.
+    """
+    if bits.size > carrier.size:
+        raise ValueError("Binary data is too large to encode in this carrier.")
+
+    head = carrier[:bits.size]
+    np.bitwise_or(head & (0xFF ^ ((1 << depth) - 1)), bits, out=head)
+
+
+def bits_to_bytes(bits):
+    """
+    Pack an array of bits into bytes, dropping any trailing partial byte.
+
+    Args:
+        bits (numpy.ndarray): The bits to pack.
+
+    Returns:
+        bytes: The packed data.
+    """
+    return np.packbits(bits[:bits.size - bits.size % 8]).tobytes()
+
+
+def iter_chunks(carrier, chunk_size=CHUNK_SIZE):
+    """
+    Yield consecutive views of a flat carrier without copying it.
+
+    Args:
+        carrier (numpy.ndarray): Flat ``uint8`` array.
+        chunk_size (int): Number of bytes per chunk.
+
+    Yields:
+        numpy.ndarray: Views of at most ``chunk_size`` bytes.
+    """
+    for start in range(0, carrier.size, chunk_size):
+        yield carrier[start:start + chunk_size]
+
+
+def extract_until(chunks, delimiter_bits, max_bits=None):
+    """
+    Read LSBs from carrier chunks until the delimiter appears.
+
+    The search runs over the raw bit stream, so the delimiter is found at
+    any bit offset, exactly like the original per-bit scan. Reading stops
+    at the chunk holding the delimiter.
+
+    Args:
+        chunks (iterable): Flat ``uint8`` carrier chunks, in order.
+        delimiter_bits (numpy.ndarray): The bit sequence marking the end of data.
+        max_bits (int, optional): Give up after reading this many bits.
+
+    Returns:
+        numpy.ndarray: The bits preceding the delimiter.
+
+    Raises:
+        ValueError: If the delimiter is not found.
+    """
+    pattern = delimiter_bits.tobytes()
+    overlap = len(pattern) - 1
+    collected = []
+    tail = np.empty(0, dtype=np.uint8)
+    read = 0
+
+    for chunk in chunks:
+        if max_bits is not None:
+            chunk = chunk[:max_bits - read]
+        read += chunk.size
+        window = np.concatenate((tail, chunk & 1))
+
+        index = window.tobytes().find(pattern)
+        if index != -1:
+            collected.append(window[:index])
+            return np.concatenate(collected)
+
+        # Keep enough bits to match a delimiter straddling two chunks
+        split = max(window.size - overlap, 0)
+        collected.append(window[:split])
+        tail = window[split:]
+
+        if max_bits is not None and read >= max_bits:
+            break
+
+    raise ValueError("End delimiter not found.")
+
+
+class CarrierReader:
+    """
+    Sequential LSB reader over a stream of carrier chunks.
+
+    Chunks are pulled from the source only when the bits they hold are
+    needed, so a decoder that knows how much to read never touches the rest
+    of the carrier.
+    """
+
+    def __init__(self, chunks):
+        """
+        Args:
+            chunks (iterable): Flat ``uint8`` carrier chunks, in order.
+        """
+        self._chunks = iter(chunks)
+        self._pending = np.empty(0, dtype=np.uint8)
+
+    def _fill(self, count):
+        parts = [self._pending]
+        available = self._pending.size
+        while available < count:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            parts.append(chunk)
+            available += chunk.size
+        if len(parts) > 1:
+            self._pending = np.concatenate(parts)
+
+    def peek(self, count):
+        """
+        Return the next ``count`` carrier bytes without consuming them.
+
+        Raises:
+            ValueError: If the carrier holds fewer than ``count`` bytes.
+        """
+        self._fill(count)
+        if self._pending.size < count:
+            raise ValueError("Carrier ended before the payload was complete.")
+        return self._pending[:count]
+
+    def peek_bits(self, count):
+        """
+        Return the next ``count`` bits without consuming them.
+
+        Raises:
+            ValueError: If the carrier holds fewer than ``count`` bits.
+        """
+        return self.peek(count) & 1
+
+    def read_bits(self, count):
+        """
+        Return and consume the next ``count`` bits.
+
+        Raises:
+            ValueError: If the carrier holds fewer than ``count`` bits.
+        """
+        bits = self.peek_bits(count)
+        self._pending = self._pending[count:]
+        return bits
+
+    def __iter__(self):
+        """Yield the unread carrier chunks."""
+        if self._pending.size:
+            pending, self._pending = self._pending, np.empty(0, dtype=np.uint8)
+            yield pending
+        yield from self._chunks
@@ -0,0 +1,279 @@
+"""
+Memory-mapped carriers for uncompressed images and PCM WAV files.
+
+Carriers whose samples are stored raw can be read and written through a
+memory map of the file itself: decoders read LSBs straight from the mapped
+pages, and encoders flip LSBs in a mapped copy of the carrier, so memory
+use does not grow with the size of the file.
+
+Image rows are exposed as ``(rows, width, 3)`` RGB views over the map, in
+the same top-down order the PIL-based engine uses, so payloads written
+either way read back either way.
+"""
+import mmap
+import wave
+
+import numpy as np
+
+from stego import lsb
+
+# Formats whose raw pixels can be mapped: (MIME type, extension)
+IMAGE_FORMATS = {
+    'BMP': ('image/bmp', 'bmp'),
+    'PPM': ('image/x-portable-pixmap', 'ppm'),
+    'TIFF': ('image/tiff', 'tiff'),
+}
+
+# Channel order of the supported raw modes, as an index into RGB
+RAW_CHANNELS = {'RGB': slice(None), 'BGR': slice(None, None, -1)}
+
+
+def image_layout(image):
+    """
+    Locate the raw pixel rows of an uncompressed 8-bit RGB image.
+
+    Only the header is used; no pixel is decoded.
+
+    Args:
+        image (PIL.Image.Image): An image as returned by ``Image.open``,
+            not loaded yet.
+
+    Returns:
+        list: (offset, top, bottom, stride, rawmode, bottom_up) for each
+        band of rows, or None if the pixels are not stored raw.
+    """
+    if image.format not in IMAGE_FORMATS or image.mode != 'RGB' or not image.tile:
+        return None
+
+    layout = []
+    for tile in image.tile:
+        args = tile.args if isinstance(tile.args, tuple) else (tile.args,)
+        rawmode = args[0]
+        stride = args[1] if len(args) > 1 and args[1] else image.width * 3
+        orientation = args[2] if len(args) > 2 else 1
+        if tile.codec_name != 'raw' or rawmode not in RAW_CHANNELS or \
+           tile.extents[0] != 0 or tile.extents[2] != image.width:
+            return None
+        layout.append((tile.offset, tile.extents[1], tile.extents[3], stride, rawmode, orientation < 0))
+    return layout
+
+
+class MappedFile:
+    """A carrier file mapped into memory; closes the map on exit."""
+
+    def __init__(self, source, writable=False):
+        """
+        Args:
+            source (str | file): Path of the file, or an open file object
+                with a file descriptor.
+            writable (bool): Map the file for writing; changes go to the file.
+
+        Raises:
+            ValueError: If the file is empty.
+        """
+        self.writable = writable
+        self._owned = isinstance(source, str)
+        self._file = open(source, 'r+b' if writable else 'rb') if self._owned else source
+        if not self._owned:
+            self._file.flush()
+        try:
+            self.map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        except ValueError:
+            self._close_file()
+            raise ValueError("Cannot map an empty carrier file.")
+
+    def view(self, offset, size):
+        """
+        Args:
+            offset (int): Start of the region in the file.
+            size (int): Length of the region.
+
+        Returns:
+            numpy.ndarray: Flat ``uint8`` view of the region, without a copy.
+
+        Raises:
+            ValueError: If the region extends past the end of the file.
+        """
+        if offset + size > len(self.map):
+            raise ValueError("The carrier file is truncated.")
+        return np.ndarray((size,), dtype=np.uint8, buffer=self.map, offset=offset)
+
+    def _close_file(self):
+        if self._owned:
+            self._file.close()
+
+    def close(self):
+        """Flush and unmap the file."""
+        if not self.map.closed:
+            if self.writable:
+                self.map.flush()
+            try:
+                self.map.close()
+            except BufferError:
+                # A caller still holds a view; the map goes away with it
+                pass
+        self._close_file()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MappedImage(MappedFile):
+    """An uncompressed RGB image whose rows are read and written in place."""
+
+    def __init__(self, source, image, layout, writable=False):
+        """
+        Args:
+            source (str | file): The image file, as for ``MappedFile``.
+            image (PIL.Image.Image): The opened image, for its size.
+            layout (list): Row bands as returned by ``image_layout``.
+            writable (bool): Map the file for writing.
+
+        Raises:
+            ValueError: If the file is truncated.
+        """
+        super().__init__(source, writable)
+        self.width = image.width
+        self.bands = []
+        try:
+            for offset, top, bottom, stride, rawmode, bottom_up in layout:
+                rows = bottom - top
+                band = self.view(offset, rows * stride).reshape(rows, stride)
+                band = band[:, :self.width * 3].reshape(rows, self.width, 3)
+                if bottom_up:
+                    band = band[::-1]
+                self.bands.append(band[..., RAW_CHANNELS[rawmode]])
+        except ValueError:
+            self.close()
+            raise
+
+    def close(self):
+        self.bands = []
+        super().close()
+
+    def capacity(self):
+        """
+        Returns:
+            int: Number of RGB channel bytes, i.e. the LSB capacity in bits.
+        """
+        return sum(band.size for band in self.bands)
+
+    def iter_chunks(self, chunk_size=lsb.CHUNK_SIZE):
+        """
+        Yield the RGB bytes in top-down row order as flat chunks.
+
+        Rows stored contiguously in RGB order are yielded as views of the
+        map; others are copied one strip at a time.
+
+        Args:
+            chunk_size (int): Approximate number of bytes per chunk.
+
+        Yields:
+            numpy.ndarray: Flat ``uint8`` chunks, in order.
+        """
+        rows_per_chunk = max(chunk_size // (self.width * 3), 1)
+        for band in self.bands:
+            for start in range(0, band.shape[0], rows_per_chunk):
+                yield np.ascontiguousarray(band[start:start + rows_per_chunk]).reshape(-1)
+
+    def embed(self, bits, depth=1):
+        """
+        Write bits into the LSBs of the leading RGB bytes, in place.
+
+        Args:
+            bits (numpy.ndarray): The bits to embed.
+            depth (int): LSBs written per carrier byte, as ``bits`` were packed with.
+
+        Raises:
+            ValueError: If the bits do not fit in the image.
+        """
+        if bits.size > self.capacity():
+            raise ValueError("Binary data is too large to encode in this image.")
+
+        row_bytes = self.width * 3
+        rows_per_chunk = max(lsb.CHUNK_SIZE // row_bytes, 1)
+        offset = 0
+        for band in self.bands:
+            for start in range(0, band.shape[0], rows_per_chunk):
+                if offset >= bits.size:
+                    return
+                rows = min(rows_per_chunk, -(-(bits.size - offset) // row_bytes))
+                strip = band[start:start + rows]
+                part = bits[offset:offset + strip.size]
+                if strip.flags.c_contiguous:
+                    lsb.embed(strip.reshape(-1), part, depth)
+                else:
+                    # Bottom-up or BGR rows are written back from a strip-sized copy
+                    flat = strip.flatten()
+                    lsb.embed(flat, part, depth)
+                    strip[...] = flat.reshape(strip.shape)
+                offset += part.size
+
+
+class MappedWav(MappedFile):
+    """A PCM WAV file whose sample bytes are read and written in place."""
+
+    def __init__(self, source, writable=False):
+        """
+        Args:
+            source (str | file): The WAV file, as for ``MappedFile``.
+            writable (bool): Map the file for writing.
+
+        Raises:
+            ValueError: If the file is not a PCM WAV file.
+        """
+        super().__init__(source, writable)
+        try:
+            self._file.seek(0)
+            with wave.open(self._file, 'rb') as reader:
+                # The reader stops at the start of the data chunk
+                data_start = 8 + reader.getfp().tell()
+                frame_size = reader.getnchannels() * reader.getsampwidth()
+                nbytes = reader.getnframes() * frame_size
+        except (wave.Error, EOFError) as e:
+            self.close()
+            raise ValueError(f"Not a PCM WAV file: {e}")
+        # A truncated file holds fewer whole frames than its header claims
+        available = len(self.map) - data_start
+        self.samples = self.view(data_start, min(nbytes, available - available % frame_size))
+
+    def close(self):
+        self.samples = None
+        super().close()
+
+    def capacity(self):
+        """
+        Returns:
+            int: Number of sample bytes, i.e. the LSB capacity in bits.
+        """
+        return self.samples.size
+
+    def iter_chunks(self, chunk_size=lsb.CHUNK_SIZE):
+        """
+        Yield the sample bytes in file order as flat views of the map.
+
+        Args:
+            chunk_size (int): Number of bytes per chunk.
+
+        Yields:
+            numpy.ndarray: Flat ``uint8`` chunks, in order.
+        """
+        return lsb.iter_chunks(self.samples, chunk_size)
+
+    def embed(self, bits, depth=1):
+        """
+        Write bits into the LSBs of the leading sample bytes, in place.
+
+        Args:
+            bits (numpy.ndarray): The bits to embed.
+            depth (int): LSBs written per carrier byte, as ``bits`` were packed with.
+
+        Raises:
+            ValueError: If the bits do not fit in the audio.
+        """
+        if bits.size > self.capacity():
+            raise ValueError("Binary data is too large to encode in this audio file.")
+        lsb.embed(self.samples, bits, depth)
@@ -0,0 +1,125 @@
+"""
+Encrypted messages hidden in carriers, as every endpoint sends and reads them.
+
+A message is encrypted with a Fernet key derived from the user's password
+and a random salt; the salt is prepended to the token and the result is
+wrapped in a payload header (``seal``). ``hide`` embeds such a payload into
+any ``carriers.Carrier`` and returns the encoded file in pieces; given a
+deferred seal, it waits for the key only once the cover is decoded. ``reveal``
+extracts and decrypts it again, deriving the key as soon as the salt has
+been read.
+"""
+import logging
+
+from cryptography.fernet import Fernet
+
+from stego import crypto, lsb, payload
+
+# End marker of legacy carriers written without a payload header
+LEGACY_DELIMITER = '10101010101010101010101010101010'
+
+# Bits scanned for the legacy delimiter in video and audio carriers
+LEGACY_MAX_BITS = 1_000_000
+
+
+def seal(text, pending_key, depth=1):
+    """
+    Encrypt a message and wrap it into a payload.
+
+    Args:
+        text (str): The secret message.
+        pending_key (crypto.PendingKey): A derivation started with a fresh salt.
+        depth (int): LSBs written per carrier byte, recorded in the header.
+
+    Returns:
+        bytes: The payload: header, salt and Fernet token.
+    """
+    fernet_key = pending_key.result()
+    encrypted_message = Fernet(fernet_key).encrypt(text.encode())
+    salted_encrypted_message = pending_key.salt + encrypted_message
+    data = payload.wrap(salted_encrypted_message, depth=depth)
+
+    logging.info(f"Salt length: {len(pending_key.salt)} bytes")
+    logging.info(f"Encrypted message length: {len(encrypted_message)} bytes")
+    logging.info(f"Salted encrypted message length: {len(salted_encrypted_message)} bytes")
+    logging.info(f"Payload length: {len(data) * 8} bits")
+    return data
+
+
+def hide(carrier, path, data, output_path=None, depth=1, progress=None):
+    """
+    Embed a sealed payload into a carrier and return the encoded file in pieces.
+
+    Args:
+        carrier (carriers.Carrier): The carrier that reads the cover.
+        path (str): Path of the cover file; it may be modified.
+        data (bytes | callable): The payload, as returned by ``seal``, or a
+            callable returning it, e.g. ``lambda: seal(text, pending_key, depth)``.
+            The carrier calls it once the cover is decoded, so a pending key
+            derivation overlaps with the decode.
+        output_path (str, optional): Scratch path for carriers that write
+            their output to disk first, with the extension of their output.
+        depth (int): LSBs written per carrier byte, as ``data`` was sealed with.
+        progress (callable, optional): Called as the output file is written,
+            e.g. the callback of ``uploads.reserve_output``.
+
+    Returns:
+        iterable: Consecutive pieces of the encoded file.
+
+    Raises:
+        ValueError: If the payload exceeds the carrier's capacity.
+    """
+    bits = data if callable(data) else lsb.as_bits(data, depth)
+    return carrier.stream(path, bits, output_path, depth, progress=progress)
+
+
+def unseal(salted_encrypted_message, keys):
+    """
+    Decrypt a payload read from a carrier.
+
+    Args:
+        salted_encrypted_message (bytes): Salt followed by the Fernet token.
+        keys (crypto.PendingKey | crypto.KeyRing): Derivations for the password.
+
+    Returns:
+        str: The decrypted message.
+
+    Raises:
+        ValueError: If the payload is too short to hold a salt.
+        InvalidToken: If the key is incorrect or the data is corrupted.
+    """
+    if len(salted_encrypted_message) < crypto.SALT_SIZE:
+        raise ValueError("Insufficient data to extract salt.")
+
+    salt = salted_encrypted_message[:crypto.SALT_SIZE]
+    encrypted_message = salted_encrypted_message[crypto.SALT_SIZE:]
+    return Fernet(keys.result(salt)).decrypt(encrypted_message).decode()
+
+
+def reveal(carrier, path, keys, delimiter=LEGACY_DELIMITER, max_bits=None, workers=None):
+    """
+    Extract and decrypt the message hidden in a carrier.
+
+    The key derivation starts as soon as the salt at the front of the
+    payload is extracted, and overlaps with reading the rest.
+
+    Args:
+        carrier (carriers.Carrier): The carrier that reads the file.
+        path (str): Path of the encoded file.
+        keys (crypto.PendingKey | crypto.KeyRing): Derivations for the password.
+        delimiter (str): End marker of legacy carriers.
+        max_bits (int, optional): Limit on the legacy delimiter scan.
+        workers (int, optional): Processes the carrier may use; its default if None.
+
+    Returns:
+        str: The decrypted message.
+
+    Raises:
+        ValueError: If no valid payload is found.
+        InvalidToken: If the key is incorrect or the data is corrupted.
+    """
+    salted_encrypted_message = carrier.extract(path, delimiter=delimiter, max_bits=max_bits,
+                                               on_prefix=(crypto.SALT_SIZE, keys.start), workers=workers)
+    logging.info(f"Payload found in {carrier.kind}.")
+    logging.info(f"Salted encrypted message length: {len(salted_encrypted_message)} bytes")
+    return unseal(salted_encrypted_message, keys)
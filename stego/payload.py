@@ -0,0 +1,159 @@
+"""
+Versioned container format for embedded payloads.
+
+Layout (big-endian), written before the payload bytes::
+
+    magic (4s) | version (B) | flags (B) | length (I) | crc32 (I)
+
+Decoders read the fixed-size header, then exactly ``length`` bytes. Carriers
+written before the header existed end with a delimiter instead; those are
+still read by scanning for it.
+
+Header and payload are embedded together at the same depth (LSBs per
+carrier byte), which the flags record. Decoders find the depth by trying
+each one until a header parses.
+"""
+import struct
+import zlib
+
+from stego import lsb
+
+MAGIC = b'STEG'
+VERSION = 1
+HEADER = struct.Struct('>4sBBII')
+HEADER_BITS = HEADER.size * 8
+
+# Header flag bits holding the embedding depth minus one
+DEPTH_FLAGS = 0x03
+
+
+def wrap(data, flags=0, depth=1):
+    """
+    Prefix data with a container header.
+
+    Args:
+        data (bytes): The payload to embed.
+        flags (int): Reserved mode bits stored in the header.
+        depth (int): LSBs per carrier byte the payload is embedded with.
+
+    Returns:
+        bytes: Header followed by the payload.
+    """
+    flags = flags & ~DEPTH_FLAGS | (depth - 1)
+    return HEADER.pack(MAGIC, VERSION, flags, len(data), zlib.crc32(data)) + data
+
+
+def header_depth(flags):
+    """
+    Args:
+        flags (int): Flags of a parsed header.
+
+    Returns:
+        int: LSBs per carrier byte the payload was embedded with.
+    """
+    return (flags & DEPTH_FLAGS) + 1
+
+
+def parse_header(raw):
+    """
+    Parse a container header.
+
+    Args:
+        raw (bytes): At least ``HEADER.size`` bytes read from the carrier.
+
+    Returns:
+        tuple: (version, flags, length, crc), or None if ``raw`` does not
+        start with a container header.
+
+    Raises:
+        ValueError: If the header is from an unsupported format version.
+    """
+    magic, version, flags, length, crc = HEADER.unpack_from(raw)
+    if magic != MAGIC:
+        return None
+    if version > VERSION:
+        raise ValueError(f"Unsupported payload format version {version}.")
+    return version, flags, length, crc
+
+
+def find_header(carrier, depth=None):
+    """
+    Find the container header at the start of a carrier.
+
+    Args:
+        carrier (numpy.ndarray): The first ``HEADER_BITS`` (or more) carrier bytes.
+        depth (int, optional): The depth to read at; every depth up to
+            ``lsb.MAX_DEPTH`` is tried if None.
+
+    Returns:
+        tuple: (header, depth) where ``header`` is as returned by
+        ``parse_header``, or (None, 1) if there is no header.
+
+    Raises:
+        ValueError: If the header is from an unsupported format version.
+    """
+    for candidate in ([depth] if depth else range(1, lsb.MAX_DEPTH + 1)):
+        size = -(-HEADER_BITS // candidate)
+        if carrier.size < size:
+            continue
+        raw = lsb.bits_to_bytes(lsb.unpack(carrier[:size], candidate)[:HEADER_BITS])
+        header = parse_header(raw)
+        # A header read at the wrong depth would have to name that depth too
+        if header is not None and (depth or header_depth(header[1]) == candidate):
+            return header, candidate
+    return None, 1
+
+
+def read(chunks, delimiter=None, max_bits=None, on_prefix=None, depth=None):
+    """
+    Read a payload from the LSBs of a stream of carrier chunks.
+
+    Args:
+        chunks (iterable): Flat ``uint8`` carrier chunks, in order.
+        delimiter (str, optional): End marker used by legacy carriers without
+            a header. Legacy carriers are rejected if not given.
+        max_bits (int, optional): Limit on the legacy delimiter scan.
+        on_prefix (tuple, optional): (size, callback). The callback receives
+            the first ``size`` payload bytes as soon as they are read, before
+            the rest of the payload is extracted.
+        depth (int, optional): LSBs per carrier byte; found from the header
+            if None. Chunks of already extracted bits are read at depth 1.
+
+    Returns:
+        bytes: The extracted payload.
+
+    Raises:
+        ValueError: If no payload is found or its checksum does not match.
+    """
+    reader = lsb.CarrierReader(chunks)
+    try:
+        head = reader.peek(HEADER_BITS)
+    except ValueError:
+        # Too small for a header, but maybe not for a short legacy payload
+        head = None
+    header, depth = find_header(head, depth) if head is not None else (None, 1)
+
+    if header is None:
+        if delimiter is None:
+            raise ValueError("No payload header found.")
+        bits = lsb.extract_until(reader, lsb.bits_from_string(delimiter), max_bits=max_bits)
+        data = lsb.bits_to_bytes(bits)
+        if on_prefix is not None:
+            on_prefix[1](data[:on_prefix[0]])
+        return data
+
+    _, _, length, crc = header
+    if depth > 1:
+        reader = lsb.CarrierReader(lsb.unpack(chunk, depth) for chunk in reader)
+    reader.read_bits(HEADER_BITS)
+
+    prefix = b''
+    if on_prefix is not None:
+        size, callback = on_prefix
+        prefix = lsb.bits_to_bytes(reader.read_bits(min(size, length) * 8))
+        callback(prefix)
+
+    data = prefix + lsb.bits_to_bytes(reader.read_bits((length - len(prefix)) * 8))
+    if zlib.crc32(data) != crc:
+        raise ValueError("Payload checksum mismatch.")
+    return data
@@ -0,0 +1,245 @@
+"""
+LSB embedding into PIL images without full-frame copies.
+
+PIL stores RGB pixels in its own buffer, which NumPy cannot share, so
+round-tripping a whole image through an array costs a copy each way. The
+embedder instead copies out only the leading row strip the payload covers,
+writes its LSBs and pastes it back into the image's own buffer.
+
+Decoders read row strips of growing height, so only the rows holding the
+payload are decoded for formats stored top to bottom. Clipping the decode
+relies on Pillow internals, so it is limited to the Pillow versions in
+``STRIP_DECODE_PILLOW``; other versions decode images whole. Uncompressed
+images on disk are read straight from a memory map instead.
+
+Encoded images are saved with a lossless encoder chosen by MIME type and a
+preset trading encoding time against file size.
+"""
+import os
+import zlib
+
+import numpy as np
+import PIL
+from PIL import Image, ImageFile
+
+from stego import lsb, mapped
+
+# Lossless output formats by MIME type, preferred first: (PIL format, extension)
+OUTPUT_FORMATS = {
+    'image/png': ('PNG', 'png'),
+    'image/webp': ('WEBP', 'webp'),
+    'image/tiff': ('TIFF', 'tiff'),
+}
+
+# Encoder options per preset and format; none of them alters a pixel
+OUTPUT_PRESETS = {
+    # Fastest zlib level with run-length matching; raw TIFF
+    'fast': {
+        'PNG': {'compress_level': 1, 'compress_type': zlib.Z_RLE},
+        'WEBP': {'lossless': True, 'quality': 0, 'method': 0},
+        'TIFF': {},
+    },
+    # PIL's default PNG and lossless WebP settings; deflate-compressed TIFF
+    'balanced': {
+        'PNG': {},
+        'WEBP': {'lossless': True},
+        'TIFF': {'compression': 'tiff_adobe_deflate'},
+    },
+    # Smallest files, for archival
+    'small': {
+        'PNG': {'compress_level': 9, 'optimize': True},
+        'WEBP': {'lossless': True, 'quality': 100, 'method': 6},
+        'TIFF': {'compression': 'tiff_adobe_deflate'},
+    },
+}
+
+# Preset used when a request does not choose one
+OUTPUT_PRESET = os.environ.get('STEGO_OUTPUT_PRESET', 'balanced')
+
+# WebP cannot store images wider or taller than this
+WEBP_MAX_SIZE = 16383
+
+# RGB bytes in the first row strip read by a decoder; later strips double
+FIRST_STRIP_BYTES = 1 << 12
+
+# Decoders that fill their tile top to bottom and can stop after any row
+ROW_ORDERED_CODECS = {'zip', 'raw'}
+
+# Pillow major versions, first and last, whose tile internals the row-strip
+# decoder was checked against
+STRIP_DECODE_PILLOW = (11, 12)
+
+# Row strips are decoded only where ImageFile._Tile behaves as expected
+_STRIP_DECODE = (STRIP_DECODE_PILLOW[0] <= int(PIL.__version__.split('.')[0]) <= STRIP_DECODE_PILLOW[1] and
+                 hasattr(getattr(ImageFile, '_Tile', None), '_replace'))
+
+
+def capacity(image):
+    """
+    Args:
+        image (PIL.Image.Image): The cover image.
+
+    Returns:
+        int: Number of RGB channel bytes, i.e. the LSB capacity in bits.
+    """
+    width, height = image.size
+    return width * height * 3
+
+
+def embed(image, bits, depth=1):
+    """
+    Write bits into the LSBs of an image's leading RGB bytes.
+
+    RGB images are modified in place; other modes are converted once first.
+    Only the rows holding payload bits are copied and written back.
+
+    Args:
+        image (PIL.Image.Image): The cover image.
+        bits (numpy.ndarray): The bits to embed.
+        depth (int): LSBs written per carrier byte, as ``bits`` were packed with.
+
+    Returns:
+        PIL.Image.Image: The encoded RGB image.
+
+    Raises:
+        ValueError: If the bits do not fit in the image.
+    """
+    if bits.size > capacity(image):
+        raise ValueError("Binary data is too large to encode in this image.")
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if not bits.size:
+        return image
+
+    width = image.size[0]
+    rows = -(-bits.size // (width * 3))
+    strip = np.array(image.crop((0, 0, width, rows)))
+    lsb.embed(strip.reshape(-1), bits, depth)
+    image.paste(Image.fromarray(strip, 'RGB'), (0, 0))
+    return image
+
+
+def _has_fileno(fp):
+    try:
+        fp.fileno()
+    except (AttributeError, OSError):
+        return False
+    return True
+
+
+def _is_row_ordered(image):
+    if not _STRIP_DECODE or image.info.get('interlace') or not image.tile:
+        return False
+    for tile in image.tile:
+        if tile.codec_name not in ROW_ORDERED_CODECS or tile.extents[0] != 0 or tile.extents[2] != image.width:
+            return False
+        # Raw tiles with a negative orientation (e.g. BMP) are stored bottom-up
+        if tile.codec_name == 'raw' and isinstance(tile.args, tuple) and len(tile.args) > 2 and tile.args[2] < 0:
+            return False
+    return True
+
+
+def _decode_rows(image, rows):
+    # Open the file again with its tiles clipped to the leading rows; the
+    # decoders stop once the clipped image is full
+    if not hasattr(image, '_size'):
+        # Decoding the whole image once is slower but needs no internals
+        return image.crop((0, 0, image.width, rows))
+    strip = Image.open(image.fp)
+    strip.tile = [tile._replace(extents=(0, tile.extents[1], strip.width, min(tile.extents[3], rows)))
+                  for tile in strip.tile if tile.extents[1] < rows]
+    strip._size = (strip.width, rows)
+    strip.load()
+    return strip
+
+
+def iter_chunks(image):
+    """
+    Yield an image's RGB bytes as flat chunks of consecutive rows.
+
+    Images whose pixel data is stored top to bottom (non-interlaced PNG,
+    PPM, uncompressed TIFF strips) are decoded lazily, in strips that double
+    in height, so a consumer that stops early decodes at most about twice
+    the rows it read. Uncompressed images in a file are memory-mapped, and
+    any other image is decoded and converted once.
+
+    Args:
+        image (PIL.Image.Image): An image as returned by ``Image.open``,
+            not loaded yet.
+
+    Yields:
+        numpy.ndarray: Flat ``uint8`` RGB chunks, in order.
+    """
+    layout = mapped.image_layout(image)
+    if layout is not None and _has_fileno(image.fp):
+        with mapped.MappedImage(image.fp, image, layout) as carrier:
+            yield from carrier.iter_chunks()
+        return
+
+    if getattr(image, 'fp', None) is None or not _is_row_ordered(image):
+        yield from lsb.iter_chunks(np.array(image.convert('RGB')).reshape(-1))
+        return
+
+    width, height = image.size
+    done = 0
+    rows = -(-FIRST_STRIP_BYTES // (width * 3))
+    while done < height:
+        rows = min(rows, height)
+        strip = _decode_rows(image, rows).crop((0, done, width, rows))
+        if strip.mode != 'RGB':
+            strip = strip.convert('RGB')
+        yield np.array(strip).reshape(-1)
+        done, rows = rows, rows * 2
+
+
+def negotiate(accept, cover_mimetype=None):
+    """
+    Pick the output format of an encoded image from an Accept header.
+
+    A cover that can be encoded in place is sent back in its own format
+    only when the client names that type outright; wildcards such as
+    ``*/*`` would otherwise match it, so they get one of the
+    ``OUTPUT_FORMATS`` instead.
+
+    Args:
+        accept (werkzeug.datastructures.MIMEAccept): The accepted MIME types.
+        cover_mimetype (str, optional): MIME type of a cover that can be
+            encoded in place.
+
+    Returns:
+        tuple: (mimetype, in_place) where ``mimetype`` is the format to send,
+        PNG by default, and ``in_place`` tells whether it is the cover's own.
+    """
+    mimetype = accept.best_match(OUTPUT_FORMATS, default='image/png')
+    if cover_mimetype is not None:
+        # Explicit entries only; accept.quality() would also count wildcards
+        quality = max((q for value, q in accept if value.lower() == cover_mimetype), default=0)
+        if quality > 0 and quality >= accept.quality(mimetype):
+            return cover_mimetype, True
+    return mimetype, False
+
+
+def save(image, output, mimetype='image/png', preset=None):
+    """
+    Save an encoded image losslessly.
+
+    Args:
+        image (PIL.Image.Image): The encoded image.
+        output (file-like): Binary stream to write to.
+        mimetype (str): One of ``OUTPUT_FORMATS``.
+        preset (str, optional): One of ``OUTPUT_PRESETS``; ``OUTPUT_PRESET`` if None.
+
+    Raises:
+        ValueError: If the format or preset is unknown, or the image is too
+            large for the format.
+    """
+    if mimetype not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format: {mimetype}")
+    preset = preset or OUTPUT_PRESET
+    if preset not in OUTPUT_PRESETS:
+        raise ValueError(f"Unknown output preset: {preset}")
+
+    image_format = OUTPUT_FORMATS[mimetype][0]
+    if image_format == 'WEBP' and max(image.size) > WEBP_MAX_SIZE:
+        raise ValueError(f"WebP output is limited to {WEBP_MAX_SIZE} pixels per side.")
+    image.save(output, format=image_format, **OUTPUT_PRESETS[preset][image_format])
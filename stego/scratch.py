@@ -0,0 +1,264 @@
+"""
+Scratch space for the temporary files of requests.
+
+Every request gets its own directory under ``SCRATCH_DIR``, removed as a
+whole when the request's response is closed, so no exit path can leak a
+file. Requests reserve their expected disk usage up front against a global
+quota and wait while it is exhausted. A reaper thread removes directories
+orphaned by crashed workers. Files whose final size is only estimated,
+such as re-encoded clips, reserve more space as they grow.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+# Root directory of the per-request scratch directories
+SCRATCH_DIR = os.environ.get('STEGO_SCRATCH_DIR', os.path.join(tempfile.gettempdir(), 'stego-scratch'))
+
+# Bytes of scratch space all requests together may reserve
+SCRATCH_QUOTA = int(os.environ.get('STEGO_SCRATCH_QUOTA', 8 << 30))
+
+# Seconds a request waits for scratch space before it is turned away
+SCRATCH_WAIT = float(os.environ.get('STEGO_SCRATCH_WAIT', 30))
+
+# Seconds after which a directory no request owns is considered orphaned
+SCRATCH_MAX_AGE = float(os.environ.get('STEGO_SCRATCH_MAX_AGE', 6 * 3600))
+
+# Seconds between two reaper passes
+REAP_INTERVAL = 300.0
+
+# Bytes reserved at a time for a file that outgrows its reservation
+RESERVE_STEP = int(os.environ.get('STEGO_SCRATCH_RESERVE_STEP', 64 << 20))
+
+
+class QuotaExceeded(ValueError):
+    """Raised when scratch space cannot be reserved."""
+
+
+class ExceedsQuota(QuotaExceeded):
+    """Raised when a reservation is larger than the whole quota, so waiting cannot help."""
+
+
+class ScratchDir:
+    """A request's scratch directory and the bytes it reserved."""
+
+    def __init__(self, space, path, reserved):
+        """
+        Args:
+            space (ScratchSpace): The space the directory belongs to.
+            path (str): The directory.
+            reserved (int): Bytes reserved for the directory.
+        """
+        self.space = space
+        self.path = path
+        self.reserved = reserved
+        self.closed = False
+
+    def file(self, suffix=''):
+        """
+        Create a named file in the directory.
+
+        Args:
+            suffix (str): File name suffix, e.g. the extension.
+
+        Returns:
+            tempfile.NamedTemporaryFile: The open file, kept when closed.
+        """
+        return tempfile.NamedTemporaryFile(dir=self.path, suffix=suffix, delete=False)
+
+    def file_path(self, suffix=''):
+        """
+        Create an empty named file in the directory.
+
+        Args:
+            suffix (str): File name suffix, e.g. the extension.
+
+        Returns:
+            str: Path of the new file.
+        """
+        fd, path = tempfile.mkstemp(dir=self.path, suffix=suffix)
+        os.close(fd)
+        return path
+
+    def reserve(self, nbytes):
+        """
+        Reserve more space for the directory, e.g. once its output size is known.
+
+        Args:
+            nbytes (int): Additional bytes the directory is expected to hold.
+
+        Raises:
+            QuotaExceeded: If the space cannot be reserved.
+        """
+        self.space.reserve(self, nbytes)
+
+    def reserve_step(self, needed):
+        """
+        Reserve space for a growing file, ``RESERVE_STEP`` bytes at a time.
+
+        Args:
+            needed (int): Bytes the file has outgrown its reservation by.
+
+        Returns:
+            int: Bytes reserved; at least ``needed``, and a whole step
+            unless that would exceed the quota.
+
+        Raises:
+            QuotaExceeded: If the space cannot be reserved.
+        """
+        nbytes = max(needed, min(RESERVE_STEP, self.space.quota - self.reserved))
+        self.reserve(nbytes)
+        return nbytes
+
+    def track(self, path, reserved=0):
+        """
+        Return a callback that reserves more space while a file grows.
+
+        Args:
+            path (str): The file being written in the directory.
+            reserved (int): Bytes already reserved for the file.
+
+        Returns:
+            callable: Takes the writer's progress count, which it ignores,
+            and reserves another ``RESERVE_STEP`` bytes whenever the file
+            has outgrown its reservation. Pass it as an encoder's ``progress``.
+        """
+        def grow(done=None):
+            nonlocal reserved
+            size = os.path.getsize(path)
+            if size > reserved:
+                reserved += self.reserve_step(size - reserved)
+
+        return grow
+
+    def close(self):
+        """Remove the directory and release its reservation. Safe to call twice."""
+        if self.closed:
+            return
+        self.closed = True
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.space.release(self)
+
+
+class ScratchSpace:
+    """
+    Quota-limited root of the per-request scratch directories.
+    """
+
+    def __init__(self, root=SCRATCH_DIR, quota=SCRATCH_QUOTA, wait=SCRATCH_WAIT, max_age=SCRATCH_MAX_AGE):
+        """
+        Args:
+            root (str): Root directory.
+            quota (int): Bytes all open directories may reserve together.
+            wait (float): Seconds ``open`` waits for space.
+            max_age (float): Age after which unowned directories are reaped.
+        """
+        self.root = root
+        self.quota = quota
+        self.wait = wait
+        self.max_age = max_age
+        self.reserved = 0
+        self._active = set()
+        self._condition = threading.Condition()
+        self._reaper = None
+
+    def open(self, nbytes=0):
+        """
+        Reserve space and create a scratch directory.
+
+        Args:
+            nbytes (int): Bytes the directory is expected to hold.
+
+        Returns:
+            ScratchDir: The new directory.
+
+        Raises:
+            ExceedsQuota: If ``nbytes`` exceeds the quota.
+            QuotaExceeded: If the space stays full for longer than the wait time.
+        """
+        if nbytes > self.quota:
+            raise ExceedsQuota("The upload is larger than the available scratch space.")
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.reserved + nbytes <= self.quota, self.wait):
+                raise QuotaExceeded("Scratch space is full; try again later.")
+            self.reserved += nbytes
+            path = os.path.join(self.root, uuid.uuid4().hex)
+            self._active.add(path)
+        os.makedirs(path)
+        self._start_reaper()
+        return ScratchDir(self, path, nbytes)
+
+    def reserve(self, scratch_dir, nbytes):
+        """
+        Grow an open directory's reservation, waiting while the space is full.
+
+        Args:
+            scratch_dir (ScratchDir): The open directory.
+            nbytes (int): Additional bytes to reserve.
+
+        Raises:
+            ExceedsQuota: If the directory's total reservation would exceed the quota.
+            QuotaExceeded: If the space stays full for longer than the wait time.
+        """
+        if scratch_dir.reserved + nbytes > self.quota:
+            raise ExceedsQuota("The upload and its output are larger than the available scratch space.")
+        with self._condition:
+            if not self._condition.wait_for(lambda: self.reserved + nbytes <= self.quota, self.wait):
+                raise QuotaExceeded("Scratch space is full; try again later.")
+            self.reserved += nbytes
+            scratch_dir.reserved += nbytes
+
+    def release(self, scratch_dir):
+        """
+        Return a closed directory's reservation to the quota.
+
+        Args:
+            scratch_dir (ScratchDir): The closed directory.
+        """
+        with self._condition:
+            self._active.discard(scratch_dir.path)
+            self.reserved -= scratch_dir.reserved
+            self._condition.notify_all()
+
+    def reap(self):
+        """Remove directories no request owns that are older than the maximum age."""
+        cutoff = time.time() - self.max_age
+        with self._condition:
+            active = set(self._active)
+        try:
+            entries = list(os.scandir(self.root))
+        except FileNotFoundError:
+            return
+        for entry in entries:
+            try:
+                expired = entry.stat().st_mtime < cutoff
+            except FileNotFoundError:
+                continue
+            if expired and entry.path not in active:
+                logging.info(f"Reaping orphaned scratch directory {entry.path}.")
+                if entry.is_dir():
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.remove(entry.path)
+
+    def _start_reaper(self):
+        with self._condition:
+            if self._reaper is not None:
+                return
+            self._reaper = threading.Thread(target=self._reap_forever, name='stego-scratch-reaper', daemon=True)
+        self._reaper.start()
+
+    def _reap_forever(self):
+        while True:
+            try:
+                self.reap()
+            except OSError as e:
+                logging.error(f"Scratch reaper error: {e}")
+            time.sleep(REAP_INTERVAL)
+
+
+SCRATCH = ScratchSpace()
@@ -0,0 +1,84 @@
+"""
+Streaming helpers for encoded files sent to clients.
+
+``ChunkSink`` lets writers that expect a file (zip, wave) produce output
+piece by piece for a generator, and ``FileChunks`` sends a finished
+temporary file in chunks and deletes it once the response is closed.
+``download_headers`` describes either kind of body to the client.
+"""
+import os
+
+# Size of the pieces a file is read and sent in
+STREAM_CHUNK_SIZE = 1 << 16
+
+
+class ChunkSink:
+    """Write-only, non-seekable file object collecting the bytes written to it."""
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """
+        Returns:
+            bytes: Everything written since the last drain.
+        """
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+class FileChunks:
+    """
+    Response body reading a temporary file in chunks.
+
+    WSGI servers call ``close`` when the response finishes or the client
+    goes away, even if the body was never iterated, so the file is always
+    removed.
+    """
+
+    def __init__(self, path, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Args:
+            path (str): Path of the file to send and delete.
+            chunk_size (int): Bytes per chunk.
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        self.size = os.path.getsize(path)
+
+    def __iter__(self):
+        with open(self.path, 'rb') as file:
+            for chunk in iter(lambda: file.read(self.chunk_size), b''):
+                yield chunk
+
+    def close(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def download_headers(body, filename):
+    """
+    Headers of an encoded file sent as an attachment.
+
+    Args:
+        body (iterable): The response body; its length is announced when
+            it is a ``FileChunks`` or a list of pieces.
+        filename (str): Name the client saves the file under.
+
+    Returns:
+        dict: Content-Disposition, and Content-Length if the size is known.
+    """
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    if isinstance(body, FileChunks):
+        headers["Content-Length"] = str(body.size)
+    elif isinstance(body, list):
+        headers["Content-Length"] = str(sum(len(piece) for piece in body))
+    return headers
@@ -0,0 +1,233 @@
+"""
+Upload handling that writes media files to disk only once.
+
+Werkzeug spools large uploads to an anonymous temporary file, and the video
+and audio decoders need a path, so endpoints used to copy every upload a
+second time with ``FileStorage.save``. ``DirectUploadRequest`` spools media
+uploads straight to named files in the request's scratch directory instead,
+and ``upload_path`` hands out their path.
+
+``init_app`` reserves scratch space for each request before its body is
+read, or while it is spooled if it has no Content-Length, and removes the
+whole directory once the response is closed.
+Outputs that can outgrow that share, such as clips re-encoded to FFV1,
+reserve their expected size with ``reserve_output`` before being written,
+and more while they grow.
+"""
+import io
+import os
+
+from flask import Request, jsonify, request
+
+from stego import scratch
+
+# Uploads with these extensions are spooled to named files
+MEDIA_EXTENSIONS = {'avi', 'mp4', 'mov', 'mkv', 'wav', 'mp3', 'flac', 'ogg', 'm4a', 'aac'}
+
+# Scratch bytes reserved per request body byte: the upload and its output
+SCRATCH_FACTOR = 2
+
+# Non-media uploads up to this size are kept in memory
+MAX_MEMORY_UPLOAD = 500 * 1024
+
+
+class ReservingFile:
+    """
+    Spool file that reserves scratch space as it is written.
+
+    Bodies without a Content-Length reserve nothing up front; every byte
+    spooled reserves ``SCRATCH_FACTOR`` bytes instead, for the upload and
+    its output, in steps of ``scratch.RESERVE_STEP``.
+    """
+
+    def __init__(self, file, reserve):
+        """
+        Args:
+            file (file object): The spool file, in the request's scratch directory.
+            reserve (callable): Like ``ScratchDir.reserve_step``.
+        """
+        self._file = file
+        self._reserve = reserve
+        self._size = 0
+        self._reserved = 0
+
+    def write(self, data):
+        self._size += len(data)
+        needed = self._size * SCRATCH_FACTOR
+        if needed > self._reserved:
+            self._reserved += self._reserve(needed - self._reserved)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class DirectUploadRequest(Request):
+    """Request that spools uploads into its own scratch directory."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._scratch = None
+        self.scratch_deferred = False
+        self.spool_error = None
+
+    @property
+    def scratch(self):
+        """
+        Returns:
+            scratch.ScratchDir: The request's scratch directory, created on first use.
+        """
+        if self._scratch is None:
+            self._scratch = scratch.SCRATCH.open()
+        return self._scratch
+
+    def open_scratch(self, nbytes):
+        """
+        Reserve scratch space for the request.
+
+        Args:
+            nbytes (int): Bytes the request is expected to write.
+
+        Raises:
+            scratch.QuotaExceeded: If the space cannot be reserved.
+        """
+        if self._scratch is None:
+            self._scratch = scratch.SCRATCH.open(nbytes)
+
+    def close_scratch(self):
+        """Remove the scratch directory, if one was created."""
+        if self._scratch is not None:
+            self._scratch.close()
+
+    def _reserve_spooled(self, needed):
+        # The form parser swallows ValueErrors, so keep the error for init_app
+        try:
+            return self.scratch.reserve_step(needed)
+        except scratch.QuotaExceeded as e:
+            self.spool_error = e
+            raise
+
+    def _spool_file(self, suffix=''):
+        file = self.scratch.file(suffix)
+        if self.content_length is None:
+            return ReservingFile(file, self._reserve_spooled)
+        return file
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        extension = os.path.splitext(filename or '')[1]
+        if extension.lower().lstrip('.') in MEDIA_EXTENSIONS:
+            return self._spool_file(extension)
+        if total_content_length is not None and total_content_length <= MAX_MEMORY_UPLOAD:
+            return io.BytesIO()
+        return self._spool_file()
+
+
+def upload_path(file_storage):
+    """
+    Return a path to an uploaded file of the current request.
+
+    Media uploads are already on disk; anything else is saved once into the
+    request's scratch directory.
+
+    Args:
+        file_storage (werkzeug.datastructures.FileStorage): The upload.
+
+    Returns:
+        str: Path of a file holding the upload.
+    """
+    name = getattr(file_storage.stream, 'name', None)
+    if isinstance(name, str) and os.path.dirname(name) == request.scratch.path:
+        file_storage.stream.flush()
+        return name
+
+    # The stream may have been read already, e.g. for the image header
+    file_storage.stream.seek(0)
+    with request.scratch.file(os.path.splitext(file_storage.filename)[1]) as temp_input:
+        file_storage.save(temp_input)
+    return temp_input.name
+
+
+def scratch_path(suffix=''):
+    """
+    Create an empty file in the current request's scratch directory.
+
+    Args:
+        suffix (str): File name suffix, e.g. the extension.
+
+    Returns:
+        str: Path of the new file.
+    """
+    return request.scratch.file_path(suffix)
+
+
+def reserve_output(nbytes, output_path):
+    """
+    Reserve scratch space for an output larger than the request's share.
+
+    Every request already holds ``SCRATCH_FACTOR - 1`` times its body size
+    for output; only the excess over that is reserved up front. The
+    returned callback reserves more if the file outgrows the estimate.
+
+    Args:
+        nbytes (int): Expected size of the output file.
+        output_path (str): The output file, in the request's scratch directory.
+
+    Returns:
+        callable: Progress callback for the writer of ``output_path``.
+
+    Raises:
+        scratch.ExceedsQuota: If the output is larger than the whole quota.
+        scratch.QuotaExceeded: If the space stays full for longer than the wait time.
+    """
+    share = (request.content_length or 0) * (SCRATCH_FACTOR - 1)
+    if nbytes > share:
+        request.scratch.reserve(nbytes - share)
+    return request.scratch.track(output_path, max(nbytes, share))
+
+
+def init_app(app):
+    """
+    Give every request of an app its own quota-limited scratch directory.
+
+    Space for the upload and its output is reserved before the body is
+    read; requests wait while the quota is exhausted and get a 503 if it
+    stays full, or a 413 if they could never fit. Multipart bodies without
+    a Content-Length are parsed up front instead, reserving space as their
+    files are spooled. The directory is removed when the response is
+    closed, after streamed bodies have been sent.
+
+    Args:
+        app (flask.Flask): The application.
+    """
+    app.request_class = DirectUploadRequest
+
+    @app.before_request
+    def reserve_scratch():
+        if request.content_length:
+            try:
+                request.open_scratch(request.content_length * SCRATCH_FACTOR)
+            except scratch.ExceedsQuota as e:
+                return jsonify({"error": str(e)}), 413
+            except scratch.QuotaExceeded as e:
+                return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
+        elif request.content_length is None and request.mimetype == 'multipart/form-data':
+            # Spool the body now, reserving space as its files are written
+            request.files
+            if isinstance(request.spool_error, scratch.ExceedsQuota):
+                return jsonify({"error": str(request.spool_error)}), 413
+            if request.spool_error is not None:
+                return jsonify({"error": str(request.spool_error)}), 503, {"Retry-After": "30"}
+
+    @app.after_request
+    def close_scratch_with_response(response):
+        # Passthrough bodies (send_file) skip close callbacks and never live
+        # in scratch space, so their directory goes at teardown instead
+        if not response.direct_passthrough:
+            response.call_on_close(request.close_scratch)
+            request.scratch_deferred = True
+        return response
+
+    @app.teardown_request
+    def close_scratch_at_teardown(exc=None):
+        if exc is not None or not request.scratch_deferred:
+            request.close_scratch()
@@ -0,0 +1,683 @@
+"""
+Video helpers for frame-by-frame LSB processing.
+
+Frames are read and written with OpenCV. When PyAV is installed, clips in an
+intra-coded lossless format can also be remuxed: only the leading GOPs that
+carry payload are re-encoded and the remaining packets are copied as-is.
+
+Long clips can be processed by a pool of worker processes that each decode
+their own frame blocks. Workers check that every seek lands on the frame
+asked for; when one does not, the rest of the clip is processed in-process,
+decoding sequentially.
+
+``encode`` and ``read_payload`` pick the best of these paths for a clip.
+Re-encoded output is always written as lossless FFV1, so no payload bit is
+lost to compression.
+"""
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+
+import cv2
+import numpy as np
+
+from stego import lsb, payload
+
+try:
+    import av
+except ImportError:  # PyAV is optional; without it every frame is re-encoded
+    av = None
+
+# Worker processes used by the parallel encoder/decoder
+DEFAULT_WORKERS = int(os.environ.get('STEGO_VIDEO_WORKERS', os.cpu_count() or 1))
+
+# Expected FFV1 output size relative to the raw frames; scratch reservations grow past it as needed
+FFV1_RATIO = float(os.environ.get('STEGO_FFV1_RATIO', 0.5))
+
+# Frames per block handed to one worker
+BLOCK_SIZE = 8
+
+# Shorter clips are not worth the cost of starting worker processes
+MIN_PARALLEL_FRAMES = 64
+
+# Blocks in flight per worker in the parallel encoder; bounds the frames held in memory
+MAX_PENDING_BLOCKS = 2
+
+# Lossless codecs whose packets can be spliced after a keyframe
+STREAM_COPY_CODECS = {'ffv1', 'rawvideo', 'png'}
+
+# RGB layouts that round-trip BGR pixels exactly, so embedded LSBs survive
+STREAM_COPY_PIX_FMTS = {'bgr24', 'bgra', 'bgr0', 'rgb24', 'rgba', 'rgb0', 'gbrp'}
+
+
+def read_frames(cap):
+    """
+    Yield the remaining frames of a capture.
+
+    Frames are decoded lazily, so consumers that stop early never decode
+    the rest of the clip.
+
+    Args:
+        cap (cv2.VideoCapture): An opened video capture.
+
+    Yields:
+        numpy.ndarray: Each BGR frame, shaped (height, width, 3).
+    """
+    while cap.isOpened():
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield frame
+
+
+def iter_frames(cap):
+    """
+    Yield the remaining frames of a capture as flat ``uint8`` arrays.
+
+    Args:
+        cap (cv2.VideoCapture): An opened video capture.
+
+    Yields:
+        numpy.ndarray: Flat view of each BGR frame.
+    """
+    for frame in read_frames(cap):
+        yield frame.reshape(-1)
+
+
+def iter_frames_from(first, cap):
+    """
+    Yield an already-read flat frame, then the rest of the capture.
+
+    Args:
+        first (numpy.ndarray): Flat frame read before.
+        cap (cv2.VideoCapture): The capture it was read from.
+
+    Yields:
+        numpy.ndarray: Flat view of each BGR frame.
+    """
+    yield first
+    yield from iter_frames(cap)
+
+
+def probe(video_path):
+    """
+    Read a video's frame count and geometry from its container metadata.
+
+    With PyAV only the container and stream headers are parsed; OpenCV is
+    used otherwise. Neither decodes any frame. Containers that do not record
+    a frame count are estimated from their duration and frame rate.
+
+    Args:
+        video_path (str): Path to the video file.
+
+    Returns:
+        tuple: (frame_count, width, height, fps).
+
+    Raises:
+        ValueError: If the video cannot be opened.
+    """
+    if av is not None:
+        try:
+            with av.open(video_path) as container:
+                stream = container.streams.video[0]
+                rate = stream.average_rate or stream.guessed_rate
+                frame_count = stream.frames
+                if not frame_count and stream.duration and rate:
+                    frame_count = int(stream.duration * stream.time_base * rate)
+                return (frame_count, stream.codec_context.width, stream.codec_context.height,
+                        float(rate) if rate else 0.0)
+        except (av.FFmpegError, IndexError):
+            pass
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError("Cannot open the video file.")
+    try:
+        return (int(cap.get(cv2.CAP_PROP_FRAME_COUNT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), cap.get(cv2.CAP_PROP_FPS))
+    finally:
+        cap.release()
+
+
+def embed_frames(cap, out, bits, progress=None, depth=1):
+    """
+    Embed bits into consecutive frames and write every frame to ``out``.
+
+    Each carrying frame is updated in place with one vectorized LSB write.
+    Frames past the last payload bit are handed to the writer exactly as
+    they were decoded, without being flattened or converted.
+
+    Args:
+        cap (cv2.VideoCapture): An opened video capture.
+        out (cv2.VideoWriter): An opened writer for the encoded video.
+        bits (numpy.ndarray): The bits to embed.
+        progress (callable, optional): Called with the number of frames written so far.
+        depth (int): LSBs written per carrier byte, as ``bits`` were packed with.
+
+    Returns:
+        int: Number of frames that carry payload bits.
+
+    Raises:
+        ValueError: If the video ends before all bits are embedded.
+    """
+    offset = 0
+    carrying = 0
+
+    for written, frame in enumerate(read_frames(cap), 1):
+        if offset < bits.size:
+            flat = frame.reshape(-1)
+            chunk = bits[offset:offset + flat.size]
+            lsb.embed(flat, chunk, depth)
+            offset += chunk.size
+            carrying += 1
+        out.write(frame)
+        if progress is not None:
+            progress(written)
+
+    if offset < bits.size:
+        raise ValueError("Binary data is too large to encode in this video.")
+    return carrying
+
+
+def _splice_encoder(stream):
+    """
+    Open an encoder whose packets can be interleaved with ``stream``'s.
+
+    Copied packets are decoded with the source stream's codec parameters, so
+    the re-encoded head must produce an identical stream header.
+
+    Args:
+        stream (av.video.stream.VideoStream): The source video stream.
+
+    Returns:
+        av.CodecContext: An opened encoder, or None if the stream cannot be spliced.
+    """
+    ctx = stream.codec_context
+    if ctx.name not in STREAM_COPY_CODECS or ctx.pix_fmt not in STREAM_COPY_PIX_FMTS:
+        return None
+
+    encoder = av.CodecContext.create(ctx.name, 'w')
+    encoder.width = ctx.width
+    encoder.height = ctx.height
+    encoder.pix_fmt = ctx.pix_fmt
+    encoder.time_base = stream.time_base
+    encoder.framerate = stream.average_rate
+    try:
+        encoder.open()
+    except av.FFmpegError:
+        return None
+
+    if bytes(encoder.extradata or b'') != bytes(ctx.extradata or b''):
+        return None
+    return encoder
+
+
+def can_stream_copy(video_path):
+    """
+    Check whether a video can be encoded with ``embed_frames_remux``.
+
+    Args:
+        video_path (str): Path to the input video file.
+
+    Returns:
+        bool: True if PyAV is available and the first video stream can be spliced.
+    """
+    if av is None:
+        return False
+    try:
+        with av.open(video_path) as container:
+            if not container.streams.video:
+                return False
+            return _splice_encoder(container.streams.video[0]) is not None
+    except av.FFmpegError:
+        return False
+
+
+def _mux_encoded(container, stream, packets):
+    for packet in packets:
+        packet.stream = stream
+        container.mux(packet)
+
+
+def embed_frames_remux(video_path, bits, output_path, progress=None, depth=1):
+    """
+    Embed bits by re-encoding only the leading GOPs that carry payload.
+
+    Frames are re-encoded with the source codec up to the first keyframe
+    after the last payload bit; every packet from that keyframe on is
+    stream-copied into the output without being decoded.
+
+    Args:
+        video_path (str): Path to the input video file.
+        bits (numpy.ndarray): The bits to embed.
+        output_path (str): Path to save the encoded video.
+        progress (callable, optional): Called with the number of frames written so far.
+        depth (int): LSBs written per carrier byte, as ``bits`` were packed with.
+
+    Returns:
+        int: Number of frames that were re-encoded.
+
+    Raises:
+        ValueError: If the video cannot be stream-copied or is too small for the bits.
+    """
+    with av.open(video_path) as source, av.open(output_path, 'w') as output:
+        in_stream = source.streams.video[0]
+        encoder = _splice_encoder(in_stream)
+        if encoder is None:
+            raise ValueError("This video cannot be stream-copied.")
+        out_stream = output.add_stream_from_template(in_stream)
+
+        offset = 0
+        reencoded = 0
+        written = 0
+        copying = False
+
+        for packet in source.demux(in_stream):
+            if packet.dts is None:
+                continue
+
+            if not copying and offset >= bits.size and packet.is_keyframe:
+                # Payload is complete; drain the encoder and splice the rest
+                _mux_encoded(output, out_stream, encoder.encode(None))
+                copying = True
+
+            if copying:
+                packet.stream = out_stream
+                output.mux(packet)
+                written += 1
+                if progress is not None:
+                    progress(written)
+                continue
+
+            for frame in packet.decode():
+                if offset < bits.size:
+                    pixels = frame.to_ndarray(format='bgr24')
+                    flat = pixels.reshape(-1)
+                    chunk = bits[offset:offset + flat.size]
+                    lsb.embed(flat, chunk, depth)
+                    offset += chunk.size
+
+                    encoded = av.VideoFrame.from_ndarray(pixels, format='bgr24')
+                    encoded = encoded.reformat(format=encoder.pix_fmt)
+                    encoded.pts = frame.pts
+                    encoded.time_base = frame.time_base
+                    frame = encoded
+
+                _mux_encoded(output, out_stream, encoder.encode(frame))
+                reencoded += 1
+                written += 1
+                if progress is not None:
+                    progress(written)
+
+        if not copying:
+            _mux_encoded(output, out_stream, encoder.encode(None))
+
+    if offset < bits.size:
+        raise ValueError("Binary data is too large to encode in this video.")
+    return reencoded
+
+
+_process_pools = {}
+_process_pools_lock = threading.Lock()
+
+
+def get_process_pool(workers):
+    """
+    Return the shared pool of ``workers`` video processes, creating it on first use.
+
+    Workers are spawned rather than forked and are reused across requests,
+    so their start-up and imports are paid once per pool size.
+
+    Args:
+        workers (int): Number of worker processes.
+
+    Returns:
+        concurrent.futures.ProcessPoolExecutor: The pool.
+    """
+    with _process_pools_lock:
+        pool = _process_pools.get(workers)
+        if pool is None:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _process_pools[workers] = pool
+        return pool
+
+
+def _discard_process_pool(workers, pool):
+    """Drop a pool whose worker died, so the next call starts a fresh one."""
+    with _process_pools_lock:
+        if _process_pools.get(workers) is pool:
+            del _process_pools[workers]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+class SeekError(ValueError):
+    """Raised when a capture cannot be positioned on a frame exactly."""
+
+
+def _seek(cap, index):
+    """Position a capture on frame ``index``, or raise SeekError if it lands elsewhere."""
+    if index and not (cap.set(cv2.CAP_PROP_POS_FRAMES, index) and
+                      int(cap.get(cv2.CAP_PROP_POS_FRAMES)) == index):
+        raise SeekError(f"Cannot seek to frame {index} exactly.")
+
+
+def _open_at(video_path, index):
+    """
+    Open a capture positioned on frame ``index``.
+
+    Seeks if the backend lands on the frame exactly; otherwise the frames
+    before it are decoded and dropped.
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        _seek(cap, index)
+    except SeekError:
+        cap.release()
+        cap = cv2.VideoCapture(video_path)
+        for _ in range(index):
+            if not cap.grab():
+                break
+    return cap
+
+
+def _embed_block(video_path, start, stop, bits, frame_bits, depth):
+    """
+    Decode frames ``start`` to ``stop`` and embed their share of bits.
+
+    ``bits`` holds only the block's own bits, starting at its first frame.
+    Returns the frames, fewer than asked if the clip ends early. Raises
+    SeekError rather than return frames from the wrong position.
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        _seek(cap, start)
+    except SeekError:
+        cap.release()
+        raise
+    frames = []
+    for index, frame in enumerate(islice(read_frames(cap), stop - start)):
+        offset = index * frame_bits
+        if offset < bits.size:
+            lsb.embed(frame.reshape(-1), bits[offset:offset + frame_bits], depth)
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def embed_frames_parallel(video_path, out, bits, frame_count, frame_bits,
+                          workers=DEFAULT_WORKERS, block_size=BLOCK_SIZE, progress=None, depth=1):
+    """
+    Embed bits with a pool of reader/embedder processes and one ordered writer.
+
+    The clip is cut into blocks of ``block_size`` frames, each sent to the
+    shared pool with only the bits that fall in it. Workers decode their
+    block with their own capture and return it embedded; the calling process
+    writes the blocks back in order. At most ``MAX_PENDING_BLOCKS`` blocks
+    per worker are in flight, so memory stays bounded whatever the clip
+    length. Frames past the container's frame count, if any, are embedded
+    in-process, and so is the rest of the clip if a worker cannot seek to
+    its block exactly.
+
+    Args:
+        video_path (str): Path to the input video file.
+        out (cv2.VideoWriter): An opened writer for the encoded video.
+        bits (numpy.ndarray): The bits to embed.
+        frame_count (int): Number of frames reported by the container.
+        frame_bits (int): Carrier bytes per frame (width * height * 3).
+        workers (int): Number of worker processes.
+        block_size (int): Frames per block.
+        progress (callable, optional): Called with the number of frames written so far.
+        depth (int): LSBs written per carrier byte, as ``bits`` were packed with.
+
+    Returns:
+        int: Number of frames that carry payload bits.
+
+    Raises:
+        ValueError: If a worker fails or the video is too small for the bits.
+    """
+    pool = get_process_pool(workers)
+    blocks = iter(range(0, frame_count, block_size))
+    pending = deque()
+
+    def submit(start):
+        stop = min(start + block_size, frame_count)
+        pending.append((pool.submit(_embed_block, video_path, start, stop,
+                                    bits[start * frame_bits:stop * frame_bits], frame_bits, depth),
+                        stop - start))
+
+    written = 0
+    complete = True
+    try:
+        for start in islice(blocks, workers * MAX_PENDING_BLOCKS):
+            submit(start)
+        while pending:
+            future, expected = pending.popleft()
+            try:
+                frames = future.result()
+            except SeekError as e:
+                # Misaligned frames would corrupt the payload; decode the rest here
+                logging.info(f"{e} Embedding the rest of the clip in-process.")
+                break
+            except BrokenProcessPool:
+                _discard_process_pool(workers, pool)
+                raise ValueError("Video worker exited unexpectedly.")
+            except Exception as e:
+                raise ValueError(f"Video worker failed: {e}")
+            for start in islice(blocks, 1):
+                submit(start)
+            for frame in frames:
+                out.write(frame)
+                written += 1
+                if progress is not None:
+                    progress(written)
+            complete = complete and len(frames) == expected
+    finally:
+        for future, _ in pending:
+            future.cancel()
+
+    if complete:
+        # The frame count may be an estimate; read whatever follows it here
+        cap = _open_at(video_path, written)
+        for frame in read_frames(cap):
+            offset = written * frame_bits
+            if offset < bits.size:
+                lsb.embed(frame.reshape(-1), bits[offset:offset + frame_bits], depth)
+            out.write(frame)
+            written += 1
+            if progress is not None:
+                progress(written)
+        cap.release()
+
+    if written * frame_bits < bits.size:
+        raise ValueError("Binary data is too large to encode in this video.")
+    return min(written, -(-bits.size // frame_bits))
+
+
+def encode(video_path, bits, output_path, stream_copy=True, workers=DEFAULT_WORKERS, progress=None,
+           depth=1):
+    """
+    Embed bits into a video and write the encoded clip.
+
+    Clips in an intra-coded lossless format are remuxed when PyAV is
+    available; otherwise every frame is re-encoded to FFV1, by a pool of
+    processes for long clips.
+
+    Args:
+        video_path (str): Path to the input video file.
+        bits (numpy.ndarray): The bits to embed.
+        output_path (str): Path to save the encoded video.
+        stream_copy (bool): Re-encode only the leading GOPs that carry payload
+            and stream-copy the rest, when the clip's codec allows it.
+        workers (int): Number of processes decoding and embedding frames.
+        progress (callable, optional): Called with the number of frames written so far.
+        depth (int): LSBs written per carrier byte, as ``bits`` were packed with.
+
+    Raises:
+        ValueError: If the video file cannot be opened, is too small for the
+            data or the FFV1 writer is unavailable.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError("Cannot open the video file.")
+
+    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+
+    # Check capacity from the container metadata before decoding any frame
+    if bits.size > frame_count * frame_width * frame_height * 3:
+        cap.release()
+        raise ValueError("Binary data is too large to encode in this video.")
+
+    if stream_copy and can_stream_copy(video_path):
+        cap.release()
+        reencoded = embed_frames_remux(video_path, bits, output_path, progress=progress, depth=depth)
+        logging.info(f"Re-encoded {reencoded} frames; remaining packets were stream-copied.")
+        return
+
+    out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'FFV1'), fps, (frame_width, frame_height))
+    if not out.isOpened():
+        cap.release()
+        raise ValueError("Cannot open the video writer with the specified codec. Ensure that 'FFV1' is installed or choose a different lossless codec.")
+
+    try:
+        if workers > 1 and frame_count >= MIN_PARALLEL_FRAMES:
+            frames_with_data = embed_frames_parallel(
+                video_path, out, bits, frame_count, frame_width * frame_height * 3, workers=workers,
+                progress=progress, depth=depth)
+        else:
+            frames_with_data = embed_frames(cap, out, bits, progress=progress, depth=depth)
+    finally:
+        cap.release()
+        out.release()
+    logging.info(f"Payload embedded in {frames_with_data} of {frame_count} frames.")
+
+
+def _extract_block(video_path, start, count, depth):
+    """Return the packed LSBs of ``count`` frames starting at ``start``, or raise SeekError."""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        _seek(cap, start)
+    except SeekError:
+        cap.release()
+        raise
+    parts = [lsb.unpack(frame, depth) for frame in islice(iter_frames(cap), count)]
+    cap.release()
+    bits = np.concatenate(parts) if parts else np.empty(0, dtype=np.uint8)
+    return np.packbits(bits), bits.size
+
+
+def read_payload_parallel(video_path, delimiter=None, max_bits=None, on_prefix=None,
+                          workers=DEFAULT_WORKERS, block_size=BLOCK_SIZE):
+    """
+    Read a payload with a pool of extraction processes.
+
+    The header is read from the first frame; the frames it announces are then
+    split into blocks that workers decode and extract concurrently. Legacy
+    carriers without a header fall back to a sequential delimiter scan.
+
+    Args:
+        video_path (str): Path to the encoded video file.
+        delimiter (str, optional): End marker of legacy carriers.
+        max_bits (int, optional): Limit on the legacy delimiter scan.
+        on_prefix (tuple, optional): (size, callback) passed to ``payload.read``.
+        workers (int): Number of worker processes.
+        block_size (int): Frames per extraction task.
+
+    Returns:
+        bytes: The extracted payload.
+
+    Raises:
+        ValueError: If the video cannot be opened or holds no valid payload.
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError("Cannot open the video file.")
+    first = next(iter_frames(cap), None)
+    if first is None:
+        cap.release()
+        raise ValueError("The video has no frames.")
+
+    header, depth = payload.find_header(first)
+
+    frame_bits = first.size
+    frames_needed = 0
+    if header is not None:
+        frames_needed = -(-(payload.HEADER_BITS + header[2] * 8) // (frame_bits * depth))
+
+    if header is None or frames_needed <= block_size:
+        # Legacy carriers and payloads spanning a few frames are read in-process
+        try:
+            return payload.read(iter_frames_from(first, cap), delimiter=delimiter,
+                                max_bits=max_bits, on_prefix=on_prefix)
+        finally:
+            cap.release()
+    cap.release()
+
+    if on_prefix is not None:
+        # The prefix sits in the first frame; hand it over before the pool starts
+        size, callback = on_prefix
+        end = payload.HEADER_BITS + min(size, header[2]) * 8
+        bits = lsb.unpack(first[:-(-end // depth)], depth)
+        callback(lsb.bits_to_bytes(bits[payload.HEADER_BITS:end]))
+
+    starts = range(0, frames_needed, block_size)
+    pool = get_process_pool(workers)
+    try:
+        results = pool.map(_extract_block, [video_path] * len(starts), starts,
+                           [min(block_size, frames_needed - start) for start in starts],
+                           [depth] * len(starts))
+        chunks = [np.unpackbits(packed, count=count) for packed, count in results]
+    except SeekError as e:
+        # Misaligned blocks would corrupt the payload; read it sequentially instead
+        logging.info(f"{e} Reading the payload in-process.")
+        cap = cv2.VideoCapture(video_path)
+        try:
+            return payload.read(iter_frames(cap), delimiter=delimiter, max_bits=max_bits)
+        finally:
+            cap.release()
+    except BrokenProcessPool:
+        _discard_process_pool(workers, pool)
+        raise ValueError("Video worker exited unexpectedly.")
+
+    # The chunks already hold one extracted bit per element
+    return payload.read(chunks, depth=1)
+
+
+def read_payload(video_path, delimiter=None, max_bits=None, on_prefix=None, workers=DEFAULT_WORKERS):
+    """
+    Read a payload from the LSBs of a video's frames.
+
+    Frames are decoded only as far as the payload reaches, by a pool of
+    processes if ``workers`` is above one.
+
+    Args:
+        video_path (str): Path to the encoded video file.
+        delimiter (str, optional): End marker of legacy carriers.
+        max_bits (int, optional): Limit on the legacy delimiter scan.
+        on_prefix (tuple, optional): (size, callback) passed to ``payload.read``.
+        workers (int): Number of processes extracting frames of long payloads.
+
+    Returns:
+        bytes: The extracted payload.
+
+    Raises:
+        ValueError: If the video cannot be opened or holds no valid payload.
+    """
+    if workers > 1:
+        return read_payload_parallel(video_path, delimiter=delimiter, max_bits=max_bits,
+                                     on_prefix=on_prefix, workers=workers)
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise ValueError("Cannot open the video file.")
+    try:
+        return payload.read(iter_frames(cap), delimiter=delimiter, max_bits=max_bits, on_prefix=on_prefix)
+    finally:
+        cap.release()